@@ -0,0 +1,39 @@
+"""add user change feed indexes
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # updated_at is now set on insert; give existing users a position in
+    # the feed
+    op.execute(
+        sa.text('UPDATE users SET updated_at = created_at WHERE updated_at IS NULL')
+    )
+    op.execute(
+        sa.text('UPDATE users_archive SET updated_at = created_at WHERE updated_at IS NULL')
+    )
+    op.execute(
+        sa.text('UPDATE users_archive SET archived_at = updated_at WHERE archived_at IS NULL')
+    )
+    op.create_index('ix_users_updated_at_id', 'users', ['updated_at', 'id'], unique=False)
+    op.create_index(
+        'ix_users_archive_archived_at_id', 'users_archive', ['archived_at', 'id'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_archive_archived_at_id', table_name='users_archive')
+    op.drop_index('ix_users_updated_at_id', table_name='users')
@@ -0,0 +1,53 @@
+"""audit users indexes
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Duplicates the primary key index
+    op.drop_index('ix_users_id', table_name='users')
+    op.create_index('ix_users_lower_email', 'users', [sa.text('lower(email)')], unique=False)
+    op.create_index('ix_users_lower_username', 'users', [sa.text('lower(username)')], unique=False)
+    op.create_index('ix_users_created_at_id', 'users', ['created_at', 'id'], unique=False)
+    op.create_index(
+        'ix_users_inactive_since',
+        'users',
+        [sa.text('coalesce(updated_at, created_at)')],
+        unique=False,
+        postgresql_where=sa.text('is_active IS false'),
+        sqlite_where=sa.text('is_active IS 0'),
+    )
+    # Only deleted rows, so hot lookups filtering on deleted_at IS NULL
+    # keep using the index for their own criteria
+    op.drop_index('ix_users_deleted_at', table_name='users')
+    op.create_index(
+        'ix_users_deleted_at',
+        'users',
+        ['deleted_at'],
+        unique=False,
+        postgresql_where=sa.text('deleted_at IS NOT NULL'),
+        sqlite_where=sa.text('deleted_at IS NOT NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_deleted_at', table_name='users')
+    op.create_index('ix_users_deleted_at', 'users', ['deleted_at'], unique=False)
+    op.drop_index('ix_users_inactive_since', table_name='users')
+    op.drop_index('ix_users_created_at_id', table_name='users')
+    op.drop_index('ix_users_lower_username', table_name='users')
+    op.drop_index('ix_users_lower_email', table_name='users')
+    op.create_index('ix_users_id', 'users', ['id'], unique=False)
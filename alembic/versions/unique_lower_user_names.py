@@ -0,0 +1,78 @@
+"""make lower-cased user emails and usernames unique
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-19
+
+"""
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def _resolve_duplicates(column: str, rename) -> None:
+    """
+    Keep the oldest user of each case-variant group as is and rename the
+    others, so the unique index can be built. Renamed users sign in with
+    the new name, which the log lists.
+    """
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.text(
+            f'SELECT id, {column} FROM users WHERE lower({column}) IN ('
+            f'SELECT lower({column}) FROM users GROUP BY lower({column}) '
+            f'HAVING count(*) > 1) ORDER BY lower({column}), id'
+        )
+    ).fetchall()
+    seen = set()
+    for user_id, value in rows:
+        if value.lower() not in seen:
+            seen.add(value.lower())
+            continue
+        new_value = rename(value, user_id)
+        while connection.execute(
+            sa.text(f'SELECT 1 FROM users WHERE lower({column}) = :value'),
+            {'value': new_value.lower()},
+        ).first():
+            new_value = rename(new_value, user_id)
+        print(f'Renamed {column} of user {user_id} from {value!r} to {new_value!r}')
+        # updated_at moves, so the rename shows up in the change feed
+        connection.execute(
+            sa.text(
+                f'UPDATE users SET {column} = :value, updated_at = :now WHERE id = :id'
+            ).bindparams(sa.bindparam('now', type_=sa.DateTime(timezone=True))),
+            {'value': new_value, 'now': datetime.now(timezone.utc), 'id': user_id},
+        )
+
+
+def _rename_username(username: str, user_id: int) -> str:
+    return f'{username}-{user_id}'
+
+
+def _rename_email(email: str, user_id: int) -> str:
+    local, _, domain = email.rpartition('@')
+    return f'{local}+{user_id}@{domain}'
+
+
+def upgrade() -> None:
+    _resolve_duplicates('email', _rename_email)
+    _resolve_duplicates('username', _rename_username)
+    op.drop_index('ix_users_lower_email', table_name='users')
+    op.drop_index('ix_users_lower_username', table_name='users')
+    op.create_index('ix_users_lower_email', 'users', [sa.text('lower(email)')], unique=True)
+    op.create_index('ix_users_lower_username', 'users', [sa.text('lower(username)')], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_lower_username', table_name='users')
+    op.drop_index('ix_users_lower_email', table_name='users')
+    op.create_index('ix_users_lower_email', 'users', [sa.text('lower(email)')], unique=False)
+    op.create_index('ix_users_lower_username', 'users', [sa.text('lower(username)')], unique=False)
@@ -1,17 +1,36 @@
 from datetime import timedelta
-from typing import Any
+from typing import Any, Dict, List
 
 from fastapi import APIRouter, Body, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
+from app.core.deps import decode_token, get_current_active_superuser
 from app.core.security import create_access_token
+from app.core.workload import AUTH, workload_route
 from app.db.session import get_db
+from app.services import refresh_token as refresh_token_service
+from app.services.activity import activity
 from app.services import user as user_service
-from app.schemas.user import User, Token
+from app.models.user import User
+from app.schemas.user import (
+    RefreshTokenRequest,
+    Token,
+    TokenIntrospection,
+    TokenIntrospectRequest,
+)
 
-router = APIRouter()
+router = APIRouter(route_class=workload_route(AUTH))
+
+
+def _access_token(user: Any) -> str:
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    return create_access_token(
+        user.id,
+        expires_delta=access_token_expires,
+        claims=user_service.token_claims(user),
+    )
 
 
 @router.post("/login", response_model=Token)
@@ -28,10 +47,68 @@ def login_access_token(
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     elif not user_service.is_active(user):
         raise HTTPException(status_code=400, detail="Inactive user")
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    activity.record_login(user.id)
+    return {
+        "access_token": _access_token(user),
+        "token_type": "bearer",
+        "refresh_token": refresh_token_service.issue(db, user=user),
+    }
+
+
+@router.post("/refresh", response_model=Token)
+def refresh_access_token(
+    db: Session = Depends(get_db), token_in: RefreshTokenRequest = Body(...)
+) -> Any:
+    """
+    Exchange a refresh token for a new access token and refresh token.
+    The presented refresh token is consumed.
+    """
+    rotated = refresh_token_service.rotate(db, token=token_in.refresh_token)
+    if not rotated:
+        raise HTTPException(status_code=400, detail="Invalid refresh token")
+    refresh_token, user = rotated
     return {
-        "access_token": create_access_token(
-            user.id, expires_delta=access_token_expires
-        ),
+        "access_token": _access_token(user),
         "token_type": "bearer",
+        "refresh_token": refresh_token,
     }
+
+
+@router.post(
+    "/introspect",
+    response_model=List[TokenIntrospection],
+    response_model_exclude_none=True,
+)
+def introspect_tokens(
+    db: Session = Depends(get_db),
+    introspect_in: TokenIntrospectRequest = Body(...),
+    current_user: User = Depends(get_current_active_superuser),
+) -> Any:
+    """
+    Check many access tokens at once, for services authorizing their own
+    callers. Results are in request order. Only superusers can access
+    this endpoint.
+    """
+    # Each distinct token is decoded once, and all their users are loaded
+    # with one IN query
+    claims = {token: decode_token(token) for token in dict.fromkeys(introspect_in.tokens)}
+    user_ids = [data.sub for data in claims.values() if data is not None]
+    users = {user.id: user for user in user_service.get_many(db, user_ids) if user}
+    results: Dict[str, dict] = {}
+    for token, data in claims.items():
+        user = users.get(data.sub) if data is not None else None
+        if (
+            user is None
+            or not user_service.is_active(user)
+            or data.ver < (user.token_version or 0)
+        ):
+            results[token] = {"active": False}
+            continue
+        activity.record_seen(user.id)
+        results[token] = {
+            "active": True,
+            "sub": user.id,
+            "is_superuser": user_service.is_superuser(user),
+            "exp": data.exp,
+        }
+    return [results[token] for token in introspect_in.tokens]
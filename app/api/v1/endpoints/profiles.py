@@ -0,0 +1,53 @@
+from typing import Any, List
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app.core import profiling
+from app.core.deps import get_current_active_superuser
+from app.core.workload import INTERACTIVE, workload_route
+from app.models.user import User
+from app.schemas.profile import Profile, ProfileSummary
+
+router = APIRouter(route_class=workload_route(INTERACTIVE))
+
+
+def _get_profile(profile_id: str) -> profiling.RequestProfile:
+    profile = profiling.profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+@router.get("/", response_model=List[ProfileSummary])
+def read_profiles(
+    current_user: User = Depends(get_current_active_superuser),
+) -> Any:
+    """
+    Recently profiled requests, most recent first. Only superusers can
+    access this endpoint.
+    """
+    return [profile.summary() for profile in profiling.profiles.list()]
+
+
+@router.get("/{profile_id}", response_model=Profile)
+def read_profile(
+    profile_id: str,
+    current_user: User = Depends(get_current_active_superuser),
+) -> Any:
+    """
+    A request's profile, with the SQL statements it issued.
+    """
+    return _get_profile(profile_id).to_dict()
+
+
+@router.get("/{profile_id}/folded", response_class=PlainTextResponse)
+def read_profile_folded(
+    profile_id: str,
+    current_user: User = Depends(get_current_active_superuser),
+) -> Any:
+    """
+    A request's sampled stacks in folded format, for flamegraph.pl or
+    speedscope.
+    """
+    return _get_profile(profile_id).folded()
@@ -1,30 +1,68 @@
-from typing import Any, List
+from typing import Any, List, Literal, Optional
 
 from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query
 from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
 
-from app.core.deps import get_current_active_superuser, get_current_active_user
+from app.core.deps import (
+    get_current_active_superuser,
+    get_current_active_user,
+    get_current_principal,
+)
+from app.core.workload import BULK, INTERACTIVE, workload, workload_route
 from app.db.session import get_db
 from app.models.user import User
 from app.schemas.user import User as UserSchema
-from app.schemas.user import UserCreate, UserUpdate
+from app.schemas.user import (
+    UserBatchItem,
+    UserAvailability,
+    UserBatchRequest,
+    UserChangePage,
+    UserCreate,
+    UserUpdate,
+)
+from app.services import archive as archive_service
+from app.services import change_feed
 from app.services import user as user_service
 
-router = APIRouter()
+router = APIRouter(route_class=workload_route(INTERACTIVE))
+
+# Ids accepted in the query string; larger sets go through POST /batch
+MAX_BATCH_QUERY_IDS = 100
+
+
+def _batch_lookup(db: Session, user_ids: List[int], current_user: User) -> List[dict]:
+    # Same rules as read_user_by_id: users may only see themselves unless
+    # they are superusers, and ids they can't see are never queried
+    see_all = user_service.is_superuser(current_user)
+    visible_ids = [
+        user_id for user_id in user_ids if see_all or user_id == current_user.id
+    ]
+    found = dict(zip(visible_ids, user_service.get_many(db, visible_ids)))
+    items = []
+    for user_id in user_ids:
+        if user_id not in found:
+            items.append({"id": user_id, "status": "forbidden"})
+        elif found[user_id] is None:
+            items.append({"id": user_id, "status": "not_found"})
+        else:
+            items.append({"id": user_id, "status": "found", "user": found[user_id]})
+    return items
 
 
 @router.get("/", response_model=List[UserSchema])
+@workload(BULK)
 def read_users(
     db: Session = Depends(get_db),
     skip: int = Query(0, description="Skip items"),
     limit: int = Query(100, description="Limit items"),
+    sort: Literal["id", "created_at"] = Query("id", description="Sort order"),
     current_user: User = Depends(get_current_active_superuser),
 ) -> Any:
     """
     Retrieve users. Only superusers can access this endpoint.
     """
-    users = user_service.get_multi(db, skip=skip, limit=limit)
+    users = user_service.get_multi(db, skip=skip, limit=limit, sort=sort)
     return users
 
 
@@ -38,13 +76,16 @@ def create_user(
     """
     Create new user. Only superusers can access this endpoint.
     """
-    user = user_service.get_by_email(db, email=user_in.email)
+    # Soft-deleted users keep their email and username until archived
+    user = user_service.get_by_email(db, email=user_in.email, include_deleted=True)
     if user:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system.",
         )
-    user = user_service.get_by_username(db, username=user_in.username)
+    user = user_service.get_by_username(
+        db, username=user_in.username, include_deleted=True
+    )
     if user:
         raise HTTPException(
             status_code=400,
@@ -78,17 +119,95 @@ def update_user_me(
     return user
 
 
+@router.get("/batch", response_model=List[UserBatchItem])
+def read_users_batch(
+    ids: str = Query(..., description="Comma-separated user IDs"),
+    current_user: User = Depends(get_current_principal),
+    db: Session = Depends(get_db),
+) -> Any:
+    """
+    Get several users by id in one request, in the order requested.
+    """
+    try:
+        user_ids = [int(user_id) for user_id in ids.split(",") if user_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if not user_ids or len(user_ids) > MAX_BATCH_QUERY_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Between 1 and {MAX_BATCH_QUERY_IDS} ids are allowed, use POST for more",
+        )
+    return _batch_lookup(db, user_ids, current_user)
+
+
+@router.post("/batch", response_model=List[UserBatchItem])
+@workload(BULK)
+def read_users_batch_post(
+    *,
+    db: Session = Depends(get_db),
+    batch_in: UserBatchRequest,
+    current_user: User = Depends(get_current_principal),
+) -> Any:
+    """
+    Get many users by id, for id sets too large for a query string.
+    """
+    return _batch_lookup(db, batch_in.ids, current_user)
+
+
+@router.get(
+    "/availability", response_model=UserAvailability, response_model_exclude_none=True
+)
+def read_availability(
+    db: Session = Depends(get_db),
+    username: Optional[str] = Query(None, max_length=255),
+    email: Optional[str] = Query(None, max_length=255),
+) -> Any:
+    """
+    Whether a username and/or email is still free, for signup forms.
+    Names are compared case-insensitively.
+    """
+    if username is None and email is None:
+        raise HTTPException(status_code=400, detail="Pass a username or an email")
+    return user_service.check_availability(db, username=username, email=email)
+
+
+@router.get("/changes", response_model=UserChangePage)
+@workload(BULK)
+def read_user_changes(
+    db: Session = Depends(get_db),
+    since: Optional[str] = Query(None, description="Cursor from the previous page"),
+    limit: int = Query(100, ge=1, le=1000, description="Limit changes"),
+    current_user: User = Depends(get_current_active_superuser),
+) -> Any:
+    """
+    Users created, updated or deleted since a cursor, oldest first.
+    Omit ``since`` to start from the beginning.
+    """
+    try:
+        cursor = change_feed.decode_cursor(since) if since else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    changes, next_cursor, has_more = change_feed.get_changes(
+        db, since=cursor, limit=limit
+    )
+    return {
+        "changes": [change._asdict() for change in changes],
+        "next_cursor": change_feed.encode_cursor(next_cursor) if next_cursor else None,
+        "has_more": has_more,
+    }
+
+
 @router.get("/{user_id}", response_model=UserSchema)
 def read_user_by_id(
     user_id: int = Path(..., description="The ID of the user to get"),
-    current_user: User = Depends(get_current_active_user),
+    current_user: User = Depends(get_current_principal),
     db: Session = Depends(get_db),
 ) -> Any:
     """
     Get a specific user by id.
     """
     user = user_service.get(db, user_id=user_id)
-    if user == current_user:
+    if user is not None and user.id == current_user.id:
         return user
     if not user_service.is_superuser(current_user):
         raise HTTPException(
@@ -136,3 +255,36 @@ def delete_user(
         )
     user = user_service.delete(db, user_id=user_id)
     return user
+
+
+@router.post("/{user_id}/restore", response_model=UserSchema)
+def restore_user(
+    *,
+    db: Session = Depends(get_db),
+    user_id: int = Path(..., description="The ID of the user to restore"),
+    current_user: User = Depends(get_current_active_superuser),
+) -> Any:
+    """
+    Restore a deleted or archived user. Only superusers can access this endpoint.
+    """
+    user = user_service.get(db, user_id=user_id)
+    if user:
+        raise HTTPException(status_code=400, detail="The user is not deleted")
+    archived = archive_service.get_archived(db, user_id=user_id)
+    if archived and (
+        user_service.get_by_email(db, email=archived.email, include_deleted=True)
+        or user_service.get_by_username(
+            db, username=archived.username, include_deleted=True
+        )
+    ):
+        raise HTTPException(
+            status_code=409,
+            detail="The email or username of this user has been taken since",
+        )
+    user = archive_service.restore(db, user_id=user_id)
+    if not user:
+        raise HTTPException(
+            status_code=404,
+            detail="The user with this ID does not exist in the system",
+        )
+    return user
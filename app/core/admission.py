@@ -0,0 +1,119 @@
+import asyncio
+import math
+from collections import deque
+from typing import Deque, Dict
+
+from fastapi.responses import JSONResponse
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+
+class AdmissionLimiter:
+    """
+    Concurrency limit for one workload class, with a bounded wait queue.
+
+    Up to ``limit`` requests run at once and up to ``queue_size`` more wait
+    for a slot, in arrival order. A request is shed instead of queued when
+    the queue is full or when, going by a moving average of service times,
+    it would wait longer than ``queue_timeout``; one that waits that long
+    anyway is shed too. All methods run on the event loop.
+    """
+
+    def __init__(
+        self, name: str, limit: int, queue_size: int, queue_timeout: float
+    ) -> None:
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+        # Exponentially weighted moving average, in seconds
+        self._service_time = 0.0
+        metrics.register_gauge(f"admission.{name}.in_flight", lambda: self.in_flight)
+        metrics.register_gauge(f"admission.{name}.queued", lambda: len(self._waiters))
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def expected_wait(self) -> float:
+        """How long a request joining the queue now would likely wait"""
+        # Requests ahead of it drain ``limit`` at a time
+        return self._service_time * (len(self._waiters) + 1) / self.limit
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.expected_wait()))
+
+    async def acquire(self) -> bool:
+        """Take a slot, waiting in the queue if needed. False means shed."""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        if (
+            len(self._waiters) >= self.queue_size
+            or self.expected_wait() > self.queue_timeout
+        ):
+            self._shed()
+            return False
+        loop = asyncio.get_running_loop()
+        waiter: "asyncio.Future[None]" = loop.create_future()
+        self._waiters.append(waiter)
+        start = loop.time()
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # The client went away while queued; pass on a slot it was given
+            if waiter.done() and not waiter.cancelled():
+                self.release(0.0)
+            else:
+                self._remove(waiter)
+            raise
+        metrics.observe(f"admission.{self.name}.wait", loop.time() - start)
+        if waiter.done():
+            return True
+        self._remove(waiter)
+        self._shed()
+        return False
+
+    def release(self, service_time: float) -> None:
+        """Free a slot, handing it straight to the next queued request"""
+        self._service_time = 0.8 * self._service_time + 0.2 * service_time
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _remove(self, waiter: "asyncio.Future[None]") -> None:
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _shed(self) -> None:
+        metrics.inc(f"admission.{self.name}.shed")
+
+
+def make_limiters() -> Dict[str, AdmissionLimiter]:
+    """One limiter per workload class configured in ADMISSION_LIMITS"""
+    return {
+        name: AdmissionLimiter(
+            name,
+            limit=limit,
+            queue_size=settings.ADMISSION_QUEUE_SIZE,
+            queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        )
+        for name, limit in settings.ADMISSION_LIMITS.items()
+    }
+
+
+def busy_response(retry_after: int) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "Server is busy, retry later"},
+        status_code=503,
+        headers={"Retry-After": str(retry_after)},
+    )
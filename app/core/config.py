@@ -1,14 +1,26 @@
 import secrets
 from typing import Any, Dict, List, Optional, Union
-from pydantic import AnyHttpUrl, EmailStr, field_validator
+from pydantic import AnyHttpUrl, EmailStr, field_validator, model_validator
 from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     SECRET_KEY: str = secrets.token_urlsafe(32)
-    # 60 minutes * 24 hours * 8 days = 8 days
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
+    # Access tokens are short-lived; clients renew them via /auth/refresh
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
+    # 60 minutes * 24 hours * 30 days = 30 days
+    REFRESH_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 30
+    # Authorize requests from the token claims alone, without loading the user
+    STATELESS_AUTH: bool = False
+    # Upper bound on revoked users kept in the in-memory token denylist
+    TOKEN_DENYLIST_MAX_ENTRIES: int = 10000
+    # Where Idempotency-Key responses are kept: "memory" or "database"
+    IDEMPOTENCY_BACKEND: str = "memory"
+    IDEMPOTENCY_TTL_SECONDS: int = 60 * 60 * 24
+    IDEMPOTENCY_MAX_ENTRIES: int = 10000
+    # How long a duplicate request waits for the original to finish
+    IDEMPOTENCY_WAIT_SECONDS: float = 10.0
     # BACKEND_CORS_ORIGINS is a JSON-formatted list of origins
     # e.g: '["http://localhost", "http://localhost:4200", "http://localhost:3000"]'
     BACKEND_CORS_ORIGINS: List[AnyHttpUrl] = []
@@ -22,10 +34,99 @@ class Settings(BaseSettings):
       
 
     PROJECT_NAME: str = "User Management API"
+
+    # Logging: "development" or "production" (JSON, background writer)
+    LOG_PROFILE: str = "development"
+    # Fraction of requests logged per path, e.g. '{"/health": 0.01}'
+    LOG_SAMPLE_RATES: Dict[str, float] = {"/health": 0.01, "/metrics": 0.01}
+    # Rotated log files are compressed, then deleted after this many days
+    LOG_RETENTION_DAYS: int = 14
+    # Rotated files written to this recently may still be open in another
+    # worker, so they aren't compressed yet
+    LOG_COMPRESS_IDLE_SECONDS: float = 5 * 60
+
+    # Days before deleted or deactivated users move to the archive table
+    USER_ARCHIVE_AFTER_DAYS: int = 30
+    # The change feed holds back changes younger than this, so a slow
+    # transaction can't commit behind a cursor already handed out
+    CHANGE_FEED_SETTLE_SECONDS: float = 1.0
+
+    # Availability checks answer from a Bloom filter of names in use, and
+    # only query the database on a possible hit
+    AVAILABILITY_FALSE_POSITIVE_RATE: float = 0.01
+    AVAILABILITY_FILTER_MIN_CAPACITY: int = 10000
+    # How often names taken through other workers are read from the change
+    # feed, and how often the filter is rebuilt to drop freed names
+    AVAILABILITY_REFRESH_SECONDS: float = 10.0
+    AVAILABILITY_REBUILD_SECONDS: float = 60 * 60
+
+    # Concurrent requests per workload class (auth, interactive, bulk).
+    # Keep the total under the threadpool size (40). No class may admit more
+    # requests than its pool slice has connections, or the extra ones would
+    # queue for a connection instead; checked at startup.
+    ADMISSION_LIMITS: Dict[str, int] = {"auth": 5, "interactive": 20, "bulk": 3}
+    # Requests allowed to wait for a slot, per workload class
+    ADMISSION_QUEUE_SIZE: int = 50
+    # Longest a request may wait for a slot before it is shed with a 503
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 2.0
+
+    # Profile 1 in N requests into the ring buffer at /profiles; 0 disables
+    # it. Superusers can profile any request with X-Profile or ?profile=,
+    # adding ";inline" to get the profile back in the response body.
+    PROFILING_SAMPLE_EVERY_N: int = 0
+    # Most recent profiles kept
+    PROFILING_MAX_PROFILES: int = 100
+    # Stack sampling interval of the sampling profiler
+    PROFILING_SAMPLE_INTERVAL_MS: float = 5.0
+
+    # Background maintenance, run by one worker at a time: elected with a
+    # PostgreSQL advisory lock, or a lock on this file for other databases.
+    # Disabling it leaves jobs on per-process state, such as the activity
+    # flush, running in every worker
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_LOCK_FILE: str = "logs/scheduler.lock"
+    # Seconds between runs of each job; 0 disables a job
+    SCHEDULER_INTERVALS: Dict[str, float] = {
+        "analyze": 24 * 60 * 60,
+        "archive_users": 60 * 60,
+        "prune_refresh_tokens": 60 * 60,
+        "prune_idempotency_keys": 60 * 60,
+        "rotate_logs": 60 * 60,
+    }
+    # Each run starts up to this fraction of its interval late
+    SCHEDULER_JITTER: float = 0.1
+    # Batch jobs stop starting new batches after this long
+    SCHEDULER_JOB_BUDGET_SECONDS: float = 60.0
+
+    # How often buffered last-login/last-seen timestamps are written
+    ACTIVITY_FLUSH_INTERVAL_SECONDS: float = 30.0
     
     # Database
     DATABASE_URL: Optional[str] = None
     SQLALCHEMY_DATABASE_URI: Optional[str] = None
+    # Databases to spread users over; empty keeps everything on the primary
+    SHARD_DATABASE_URLS: List[str] = []
+    # With psycopg 3 (postgresql+psycopg://), statements run this many times
+    # on a connection are prepared server-side; unset it behind PgBouncer
+    # in transaction mode. psycopg2 has no server-side prepared statements.
+    DB_PREPARE_THRESHOLD: Optional[int] = 5
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    # Seconds to wait for a pooled connection before failing with a 503
+    DB_POOL_TIMEOUT: float = 5.0
+    # Pools of their own for these workload classes and for scheduled
+    # maintenance; the interactive class uses the DB_POOL_SIZE pool
+    WORKLOAD_POOL_SIZES: Dict[str, int] = {"auth": 5, "bulk": 3, "maintenance": 1}
+    # Pool connections opened per database before reporting ready
+    DB_WARMUP_CONNECTIONS: int = 5
+    # Applied on connect to file-backed SQLite databases
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    # NORMAL is durable across application crashes in WAL mode
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    # Negative values are in KiB, so this is 64 MiB per connection
+    SQLITE_CACHE_SIZE: int = -64000
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
 
 
     @field_validator("SQLALCHEMY_DATABASE_URI", mode="before")
@@ -36,6 +137,20 @@ class Settings(BaseSettings):
             return info.data.get("DATABASE_URL")
         raise ValueError("DATABASE_URL must be set")
 
+    @model_validator(mode="after")
+    def check_admission_limits(self) -> "Settings":
+        for name, limit in self.ADMISSION_LIMITS.items():
+            # Classes without a slice of their own share the main pool
+            connections = self.WORKLOAD_POOL_SIZES.get(
+                name, self.DB_POOL_SIZE + self.DB_MAX_OVERFLOW
+            )
+            if limit > connections:
+                raise ValueError(
+                    f"ADMISSION_LIMITS[{name!r}] is {limit}, more than the "
+                    f"{connections} connections in its pool"
+                )
+        return self
+
     model_config = {
         "case_sensitive": True,
         "env_file": ".env"
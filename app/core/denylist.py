@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.core.config import settings
+
+# Version recorded for users whose every token must be rejected (e.g. deleted)
+REVOKE_ALL = 2 ** 31 - 1
+
+
+class DenylistBackend:
+    """Storage for revoked token versions, keyed by user id.
+
+    An entry ``user_id -> min_version`` means every token for that user
+    carrying a lower ``ver`` claim is revoked. Entries only need to live as
+    long as the longest-lived access token. Subclass this to share the
+    denylist between workers (e.g. backed by Redis).
+    """
+
+    def add(self, user_id: int, min_version: int, ttl: float) -> None:
+        raise NotImplementedError
+
+    def get(self, user_id: int) -> Optional[int]:
+        raise NotImplementedError
+
+    def issued_before(self) -> float:
+        """Tokens issued at or before this timestamp are rejected"""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryDenylistBackend(DenylistBackend):
+    """Process-local denylist with bounded memory.
+
+    When ``max_entries`` is exceeded the oldest entry is evicted and the
+    global ``issued_before`` watermark is raised to its revocation time, so
+    eviction can only ever reject more tokens, never accept a revoked one.
+    """
+
+    def __init__(self, max_entries: int = 10000) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[int, float, float]]" = OrderedDict()
+        self._issued_before = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, user_id: int, min_version: int, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            previous = self._entries.pop(user_id, None)
+            if previous is not None:
+                min_version = max(min_version, previous[0])
+            self._entries[user_id] = (min_version, now, now + ttl)
+            self._evict(now)
+
+    def get(self, user_id: int) -> Optional[int]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        min_version, _, expires_at = entry
+        if expires_at <= time.time():
+            return None
+        return min_version
+
+    def issued_before(self) -> float:
+        return self._issued_before
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._issued_before = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, now: float) -> None:
+        # Entries are kept in insertion order, so expired ones sit at the front
+        while self._entries:
+            user_id, (_, revoked_at, expires_at) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[user_id]
+            if expires_at > now:
+                self._issued_before = max(self._issued_before, revoked_at)
+
+
+class TokenDenylist:
+    """Front-end to the configured denylist backend"""
+
+    def __init__(self, backend: DenylistBackend) -> None:
+        self.backend = backend
+
+    def set_backend(self, backend: DenylistBackend) -> None:
+        self.backend = backend
+
+    def revoke(self, user_id: int, min_version: int = REVOKE_ALL) -> None:
+        ttl = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        self.backend.add(user_id, min_version, ttl)
+
+    def is_revoked(
+        self, user_id: int, version: int = 0, issued_at: Optional[float] = None
+    ) -> bool:
+        if issued_at is not None and issued_at <= self.backend.issued_before():
+            return True
+        min_version = self.backend.get(user_id)
+        return min_version is not None and version < min_version
+
+
+denylist = TokenDenylist(
+    MemoryDenylistBackend(max_entries=settings.TOKEN_DENYLIST_MAX_ENTRIES)
+)
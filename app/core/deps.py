@@ -8,35 +8,86 @@ from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app.models.user import User
 from app.core.config import settings
+from app.core.denylist import denylist
 from app.core.security import ALGORITHM
 from app.schemas.user import TokenPayload
+from app.services import user as user_service
+from app.services.activity import activity
 
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/auth/login"
 )
 
 
-def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
-) -> User:
+def decode_token(token: str) -> Optional[TokenPayload]:
+    """Claims of a validly signed, unexpired and unrevoked token, else None"""
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[ALGORITHM]
         )
         token_data = TokenPayload(**payload)
     except (JWTError, ValidationError):
+        return None
+    if denylist.is_revoked(token_data.sub, token_data.ver, token_data.iat):
+        return None
+    return token_data
+
+
+def get_token_payload(token: str = Depends(oauth2_scheme)) -> TokenPayload:
+    token_data = decode_token(token)
+    if token_data is None:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = db.query(User).filter(User.id == token_data.sub).first()
+    return token_data
+
+
+def get_current_user(
+    db: Session = Depends(get_db),
+    token_data: TokenPayload = Depends(get_token_payload),
+) -> User:
+    user = user_service.get(db, user_id=token_data.sub, coalesce=False)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    if token_data.ver < (user.token_version or 0):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    activity.record_seen(user.id)
+    # The lookup began a transaction; end it, so the endpoint's own reads
+    # can still be coalesced with other requests'
+    user_service.end_read_transaction(db, user)
     return user
 
 
+def get_current_principal(
+    db: Session = Depends(get_db),
+    token_data: TokenPayload = Depends(get_token_payload),
+) -> User:
+    """
+    Identify the caller for authorization checks only.
+
+    With STATELESS_AUTH enabled and a token carrying claims, this returns a
+    transient User built from the claims without touching the database.
+    Only ``id``, ``is_active`` and ``is_superuser`` are meaningful on it.
+    """
+    if not settings.STATELESS_AUTH or token_data.is_active is None:
+        return get_current_user(db=db, token_data=token_data)
+    if not token_data.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    activity.record_seen(token_data.sub)
+    return User(
+        id=token_data.sub,
+        is_active=token_data.is_active,
+        is_superuser=bool(token_data.is_superuser),
+        token_version=token_data.ver,
+    )
+
+
 def get_current_active_user(
     current_user: User = Depends(get_current_user),
 ) -> User:
@@ -46,7 +97,7 @@ def get_current_active_user(
 
 
 def get_current_active_superuser(
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_principal),
 ) -> User:
     if not current_user.is_superuser:
         raise HTTPException(
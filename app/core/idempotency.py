@@ -0,0 +1,254 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.idempotency_key import IdempotencyKey
+
+
+class StoredResponse(NamedTuple):
+    status_code: int
+    content_type: Optional[str]
+    body: bytes
+
+
+class Record(NamedTuple):
+    fingerprint: str
+    # None while the original request is in flight
+    response: Optional[StoredResponse]
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a request with a different body"""
+
+
+class IdempotencyInFlight(Exception):
+    """The original request didn't finish within the wait budget"""
+
+
+class IdempotencyBackend:
+    """Storage for responses to requests carrying an Idempotency-Key.
+
+    ``claim`` is the only operation that needs to be atomic: it either
+    records a new in-flight entry and returns None, making the caller
+    responsible for ``complete`` or ``release``, or returns the live entry
+    already stored under the key.
+    """
+
+    def claim(self, key: str, fingerprint: str, ttl: float) -> Optional[Record]:
+        raise NotImplementedError
+
+    def complete(self, key: str, response: StoredResponse) -> None:
+        raise NotImplementedError
+
+    def release(self, key: str) -> None:
+        raise NotImplementedError
+
+    def prune(self) -> int:
+        """Drop expired entries, returning how many were removed"""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryIdempotencyBackend(IdempotencyBackend):
+    """Process-local store holding at most ``max_entries`` responses"""
+
+    def __init__(self, max_entries: int = 10000) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Record, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, key: str, fingerprint: str, ttl: float) -> Optional[Record]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+            self._entries.pop(key, None)
+            self._entries[key] = (Record(fingerprint, None), now + ttl)
+            self._evict(now)
+        return None
+
+    def complete(self, key: str, response: StoredResponse) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0]._replace(response=response), entry[1])
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def prune(self) -> int:
+        with self._lock:
+            before = len(self._entries)
+            self._evict(time.time())
+            return before - len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, now: float) -> None:
+        # Every entry has the same TTL, so the oldest ones expire first
+        while self._entries:
+            key, (_, expires_at) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+
+class DatabaseIdempotencyBackend(IdempotencyBackend):
+    """Store shared by every worker, in the ``idempotency_keys`` table"""
+
+    def __init__(self, session_factory: Callable[[], Session]) -> None:
+        self.session_factory = session_factory
+
+    def claim(self, key: str, fingerprint: str, ttl: float) -> Optional[Record]:
+        now = datetime.now(timezone.utc)
+        db = self.session_factory()
+        try:
+            # The primary key makes the insert the atomic claim
+            for _ in range(2):
+                db.add(
+                    IdempotencyKey(
+                        key=key,
+                        fingerprint=fingerprint,
+                        expires_at=now + timedelta(seconds=ttl),
+                    )
+                )
+                try:
+                    db.commit()
+                    return None
+                except IntegrityError:
+                    db.rollback()
+                row = db.execute(
+                    select(IdempotencyKey).where(
+                        IdempotencyKey.key == key, IdempotencyKey.expires_at > now
+                    )
+                ).scalar_one_or_none()
+                if row is not None:
+                    response = None
+                    if row.status_code is not None:
+                        response = StoredResponse(
+                            row.status_code, row.content_type, row.body or b""
+                        )
+                    return Record(row.fingerprint, response)
+                # Expired but not pruned yet: drop it and claim again
+                db.execute(
+                    delete(IdempotencyKey).where(
+                        IdempotencyKey.key == key, IdempotencyKey.expires_at <= now
+                    )
+                )
+                db.commit()
+            raise IdempotencyInFlight(key)
+        finally:
+            db.close()
+
+    def complete(self, key: str, response: StoredResponse) -> None:
+        db = self.session_factory()
+        try:
+            db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == key)
+                .values(
+                    status_code=response.status_code,
+                    content_type=response.content_type,
+                    body=response.body,
+                )
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def release(self, key: str) -> None:
+        self._delete(IdempotencyKey.key == key)
+
+    def prune(self) -> int:
+        return self._delete(IdempotencyKey.expires_at <= datetime.now(timezone.utc))
+
+    def clear(self) -> None:
+        self._delete(IdempotencyKey.key.is_not(None))
+
+    def _delete(self, criterion) -> int:
+        db = self.session_factory()
+        try:
+            deleted = db.execute(delete(IdempotencyKey).where(criterion)).rowcount
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+
+class IdempotencyStore:
+    """Front-end to the configured backend that also waits out duplicates"""
+
+    # Upper bound on how long a waiting duplicate goes between checks, for
+    # backends shared with other processes that can't notify this one
+    poll_interval = 0.05
+
+    def __init__(self, backend: IdempotencyBackend) -> None:
+        self.backend = backend
+        self._finished = threading.Condition()
+
+    def set_backend(self, backend: IdempotencyBackend) -> None:
+        self.backend = backend
+
+    def begin(self, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        """
+        Claim ``key`` for a new request, returning None, or return the
+        stored response of the original request, waiting for it if it is
+        still in flight.
+        """
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        waited = False
+        while True:
+            record = self.backend.claim(
+                key, fingerprint, settings.IDEMPOTENCY_TTL_SECONDS
+            )
+            if record is None:
+                return None
+            if record.fingerprint != fingerprint:
+                metrics.inc("idempotency.conflicts")
+                raise IdempotencyConflict(key)
+            if record.response is not None:
+                metrics.inc("idempotency.replayed")
+                return record.response
+            if not waited:
+                metrics.inc("idempotency.waited")
+                waited = True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise IdempotencyInFlight(key)
+            with self._finished:
+                self._finished.wait(min(remaining, self.poll_interval))
+
+    def complete(self, key: str, response: StoredResponse) -> None:
+        self.backend.complete(key, response)
+        self._notify()
+
+    def release(self, key: str) -> None:
+        """Forget a request that failed, so a retry runs it again"""
+        self.backend.release(key)
+        self._notify()
+
+    def _notify(self) -> None:
+        with self._finished:
+            self._finished.notify_all()
+
+
+idempotency = IdempotencyStore(
+    MemoryIdempotencyBackend(max_entries=settings.IDEMPOTENCY_MAX_ENTRIES)
+)
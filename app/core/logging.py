@@ -1,10 +1,22 @@
+import gzip
+import json
 import logging
+import os
+import queue
+import random
+import shutil
 import sys
-from typing import Any, Dict, List, Tuple
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional, TextIO, Tuple, Union
 
 from loguru import logger
 from pydantic import BaseModel
 
+from app.core.config import settings
+from app.core.metrics import metrics
+
 
 class LogConfig(BaseModel):
     """Logging configuration"""
@@ -12,6 +24,13 @@ class LogConfig(BaseModel):
     LOGGER_NAME: str = "user_management_api"
     LOG_FORMAT: str = "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
     LOG_LEVEL: str = "INFO"
+    LOG_FILE: str = "logs/user_management_api.log"
+    LOG_FILE_MAX_BYTES: int = 10 * 1024 * 1024
+    # Records buffered for the background writer before new ones are dropped
+    LOG_QUEUE_SIZE: int = 10000
+    # "development": colorized text written inline
+    # "production": JSON lines written by a background writer thread
+    LOG_PROFILE: str = settings.LOG_PROFILE
 
     # Logging config
     version: int = 1
@@ -35,52 +54,258 @@ class LogConfig(BaseModel):
     }
 
 
-def setup_logging() -> None:
-    """Configure loguru logger"""
-    config = LogConfig()
+class BackgroundLogWriter:
+    """
+    Loguru sink that writes JSON lines from a dedicated thread.
+
+    The request path only appends the record to a bounded queue; JSON
+    encoding and all I/O happen on the writer thread. When the queue is full
+    records are dropped and counted rather than blocking the caller.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 10 * 1024 * 1024,
+        max_queue: int = 10000,
+        stream: Optional[TextIO] = None,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stream = stream or sys.stderr
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(max_queue)
+        self._file: Optional[TextIO] = None
+        # Size of the file as of the last check plus what was written since
+        self._size = 0
+        self._thread = threading.Thread(
+            target=self._run, name="log-writer", daemon=True
+        )
+
+    def __call__(self, message: Any) -> None:
+        try:
+            self._queue.put_nowait(message.record)
+        except queue.Full:
+            metrics.inc("logging.dropped")
+
+    def start(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Write out everything queued so far and stop the thread"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    @staticmethod
+    def format(record: Dict[str, Any]) -> str:
+        entry = {
+            "time": record["time"].isoformat(),
+            "level": record["level"].name,
+            "name": record["name"],
+            "function": record["function"],
+            "line": record["line"],
+            "message": record["message"],
+        }
+        if record["extra"]:
+            entry["extra"] = record["extra"]
+        if record["exception"]:
+            entry["exception"] = "".join(
+                traceback.format_exception(*record["exception"])
+            )
+        return json.dumps(entry, default=str) + "\n"
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            line = self.format(record)
+            self.stream.write(line)
+            self._file.write(line)
+            # Lines are ASCII, json.dumps escaping the rest, so a character
+            # is a byte
+            self._size += len(line)
+            # Flush once the burst is written rather than per record. Under
+            # sustained load the queue never empties, so also check once the
+            # file may have outgrown max_bytes.
+            if self._queue.empty() or self._size >= self.max_bytes:
+                self.stream.flush()
+                self._file.flush()
+                self._rotate_if_needed()
+        self.stream.flush()
+        self._file.flush()
+
+    def _rotate_if_needed(self) -> None:
+        # Other worker processes may append to the same file too
+        self._size = self._file.tell()
+        if self._size < self.max_bytes:
+            return
+        # Worker processes share the file; if another one has already
+        # rotated it, follow to the new file rather than rotating that too
+        try:
+            rotated = os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = True
+        self._file.close()
+        if not rotated:
+            os.rename(self.path, f"{self.path}.{time.strftime('%Y-%m-%d_%H-%M-%S')}")
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+
+_log_writer: Optional[BackgroundLogWriter] = None
 
-    # Remove default logger
-    logger.remove()
-    # Add new configuration
-    logger.add(
-        sys.stderr,
-        format=config.LOG_FORMAT,
-        level=config.LOG_LEVEL,
-        colorize=True,
-    )
-    # Also log to file
-    logger.add(
-        "logs/user_management_api.log",
-        rotation="10 MB",
-        retention="1 week",
-        format=config.LOG_FORMAT,
-        level=config.LOG_LEVEL,
-    )
 
-    # Intercept standard logging
-    class InterceptHandler(logging.Handler):
-        def emit(self, record: logging.LogRecord) -> None:
-            # Get corresponding Loguru level if it exists
+class InterceptHandler(logging.Handler):
+    """Forward standard logging records to loguru"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._levels: Dict[int, Union[str, int]] = {}
+
+    def _level(self, record: logging.LogRecord) -> Union[str, int]:
+        # Get corresponding Loguru level if it exists, once per level number
+        level = self._levels.get(record.levelno)
+        if level is None:
             try:
                 level = logger.level(record.levelname).name
             except ValueError:
                 level = record.levelno
+            self._levels[record.levelno] = level
+        return level
 
-            # Find caller from where originated the logged message
-            frame, depth = logging.currentframe(), 2
-            while frame.f_code.co_filename == logging.__file__:
-                frame = frame.f_back
-                depth += 1
+    def emit(self, record: logging.LogRecord) -> None:
+        # Find the caller by skipping the stdlib's frames, as their number
+        # varies: Logger.exception and module-level logging.info add some
+        frame, depth = logging.currentframe(), 0
+        while frame and (depth == 0 or frame.f_code.co_filename == logging.__file__):
+            frame = frame.f_back
+            depth += 1
 
-            logger.opt(depth=depth, exception=record.exc_info).log(
-                level, record.getMessage()
-            )
+        logger.opt(depth=depth, exception=record.exc_info).log(
+            self._level(record), record.getMessage()
+        )
+
+
+def should_log_request(path: str) -> bool:
+    """Apply the per-route sampling rate from LOG_SAMPLE_RATES"""
+    rate = settings.LOG_SAMPLE_RATES.get(path)
+    return rate is None or random.random() < rate
+
+
+def rotate_log_files(
+    config: Optional[LogConfig] = None,
+    *,
+    retention_days: Optional[int] = None,
+    idle_seconds: Optional[float] = None,
+    deadline: Optional[float] = None,
+) -> Tuple[int, int]:
+    """
+    Compress log files already rotated out next to LOG_FILE, and delete
+    those older than ``retention_days``. The file being written is never
+    touched, nor is a rotated one modified in the last ``idle_seconds``,
+    which another worker may still be writing to until it notices the
+    rotation. Stops once the ``time.monotonic()`` ``deadline`` passes.
+    Returns the number of files compressed and deleted.
+    """
+    config = config or LogConfig()
+    if retention_days is None:
+        retention_days = settings.LOG_RETENTION_DAYS
+    if idle_seconds is None:
+        idle_seconds = settings.LOG_COMPRESS_IDLE_SECONDS
+    directory, active = os.path.split(config.LOG_FILE)
+    directory = directory or "."
+    # Both the background writer's and loguru's rotated names start so
+    prefix = f"{os.path.splitext(active)[0]}."
+    now = time.time()
+    cutoff = now - retention_days * 24 * 60 * 60
+    compressed = deleted = 0
+    for name in sorted(os.listdir(directory)):
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        if name == active or not name.startswith(prefix):
+            continue
+        path = os.path.join(directory, name)
+        modified = os.path.getmtime(path)
+        if modified < cutoff:
+            os.remove(path)
+            deleted += 1
+        elif not name.endswith(".gz") and modified < now - idle_seconds:
+            with open(path, "rb") as source, gzip.open(f"{path}.gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            # Keep the age retention is judged by
+            os.utime(f"{path}.gz", (modified, modified))
+            os.remove(path)
+            compressed += 1
+    return compressed, deleted
+
+
+def setup_logging(config: Optional[LogConfig] = None) -> None:
+    """Configure loguru logger"""
+    global _log_writer
+    config = config or LogConfig()
+    production = config.LOG_PROFILE == "production"
+
+    # Remove default logger
+    logger.remove()
+    shutdown_logging()
+    # Add new configuration
+    if production:
+        # One sink feeds both stderr and the file from the writer thread;
+        # diagnose would format locals on every exception
+        _log_writer = BackgroundLogWriter(
+            config.LOG_FILE,
+            max_bytes=config.LOG_FILE_MAX_BYTES,
+            max_queue=config.LOG_QUEUE_SIZE,
+        )
+        _log_writer.start()
+        logger.add(
+            _log_writer,
+            format="{message}",
+            level=config.LOG_LEVEL,
+            backtrace=False,
+            diagnose=False,
+        )
+    else:
+        logger.add(
+            sys.stderr,
+            format=config.LOG_FORMAT,
+            level=config.LOG_LEVEL,
+            colorize=True,
+        )
+        # Also log to file
+        logger.add(
+            config.LOG_FILE,
+            rotation="10 MB",
+            retention="1 week",
+            format=config.LOG_FORMAT,
+            level=config.LOG_LEVEL,
+        )
+
+    intercept_handler = InterceptHandler()
 
     # Replace all handlers with interceptor
     for name in logging.root.manager.loggerDict.keys():
         if name.startswith("uvicorn."):
-            logging.getLogger(name).handlers = [InterceptHandler()]
+            logging.getLogger(name).handlers = [intercept_handler]
+
+    # Configure standard logging; records below the level never reach loguru
+    logging.basicConfig(
+        handlers=[intercept_handler],
+        level=logging.getLevelName(config.LOG_LEVEL),
+    )
+    logging.getLogger("uvicorn.access").handlers = [intercept_handler]
+
 
-    # Configure standard logging
-    logging.basicConfig(handlers=[InterceptHandler()], level=0)
-    logging.getLogger("uvicorn.access").handlers = [InterceptHandler()]
+def shutdown_logging() -> None:
+    """Drain the background writer, if the production profile started one"""
+    global _log_writer
+    if _log_writer is not None:
+        _log_writer.stop()
+        _log_writer = None
@@ -0,0 +1,43 @@
+import threading
+from typing import Any, Callable, Dict
+
+
+class Metrics:
+    """In-process counters, gauges and timings, exposed at /metrics"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def register_gauge(self, name: str, fn: Callable[[], float]) -> None:
+        """Register a callable that is read whenever metrics are collected"""
+        self._gauges[name] = fn
+
+    def set_gauge(self, name: str, value: float) -> None:
+        self._gauges[name] = lambda: value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            timing = self._timings.setdefault(
+                name, {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+            )
+            timing["count"] += 1
+            timing["total"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+            timing["last"] = seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {name: dict(timing) for name, timing in self._timings.items()}
+        gauges = {name: fn() for name, fn in list(self._gauges.items())}
+        return {"counters": counters, "gauges": gauges, "timings": timings}
+
+
+metrics = Metrics()
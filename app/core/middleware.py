@@ -1,34 +1,52 @@
+import hashlib
 import time
-from typing import Callable
+from typing import Callable, Dict, List
 
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 from loguru import logger
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.idempotency import (
+    IdempotencyConflict,
+    IdempotencyInFlight,
+    StoredResponse,
+    idempotency,
+)
+from app.core.logging import should_log_request
 
 
 class RequestLoggingMiddleware(BaseHTTPMiddleware):
     """Middleware for logging request information"""
 
     async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         # Process the request
         try:
             response = await call_next(request)
-            process_time = time.time() - start_time
+            process_time = time.perf_counter() - start_time
             
-            # Log request details
-            logger.info(
-                f"{request.method} {request.url.path} "
-                f"[{response.status_code}] "
-                f"{process_time:.4f}s"
-            )
+            # Log request details, sampled for high-volume routes
+            path = request.url.path
+            if should_log_request(path):
+                logger.info(
+                    "{} {} [{}] {:.4f}s",
+                    request.method,
+                    path,
+                    response.status_code,
+                    process_time,
+                )
             
             # Add custom header with processing time
             response.headers["X-Process-Time"] = str(process_time)
             return response
         except Exception as e:
-            process_time = time.time() - start_time
+            process_time = time.perf_counter() - start_time
             logger.error(
                 f"{request.method} {request.url.path} "
                 f"[500] "
@@ -38,6 +56,131 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
             raise
 
 
+class IdempotencyMiddleware:
+    """
+    Replay the stored response to a mutating request retried with the same
+    Idempotency-Key, instead of running the endpoint again.
+
+    Written as plain ASGI middleware, as it has to read the request body
+    and capture the response body.
+    """
+
+    methods = {"POST", "PUT", "PATCH", "DELETE"}
+    max_key_length = 255
+    # Their responses carry access and refresh tokens, which must not be
+    # stored in plain text; retries run the endpoint again
+    excluded_paths = {
+        f"{settings.API_V1_STR}/auth/login",
+        f"{settings.API_V1_STR}/auth/refresh",
+    }
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in self.methods
+            or scope["path"] in self.excluded_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        idempotency_key = headers.get("idempotency-key")
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency_key or len(idempotency_key) > self.max_key_length:
+            response = JSONResponse(
+                {"detail": "Invalid Idempotency-Key header"}, status_code=400
+            )
+            await response(scope, receive, send)
+            return
+
+        body = await self._read_body(receive)
+        # Keys are scoped to the caller and the endpoint, so one client can't
+        # replay another's response
+        key = hashlib.sha256(
+            "\n".join(
+                [
+                    scope["method"],
+                    scope["path"],
+                    headers.get("authorization", ""),
+                    idempotency_key,
+                ]
+            ).encode()
+        ).hexdigest()
+        fingerprint = hashlib.sha256(body).hexdigest()
+        try:
+            stored = await run_in_threadpool(idempotency.begin, key, fingerprint)
+        except IdempotencyConflict:
+            response = JSONResponse(
+                {"detail": "Idempotency-Key was already used for a different request"},
+                status_code=422,
+            )
+            await response(scope, receive, send)
+            return
+        except IdempotencyInFlight:
+            response = JSONResponse(
+                {"detail": "A request with this Idempotency-Key is still in progress"},
+                status_code=409,
+            )
+            await response(scope, receive, send)
+            return
+        if stored is not None:
+            response = Response(
+                stored.body,
+                status_code=stored.status_code,
+                media_type=stored.content_type,
+                headers={"Idempotent-Replayed": "true"},
+            )
+            await response(scope, receive, send)
+            return
+
+        await self._run(scope, body, send, key)
+
+    async def _run(self, scope: Scope, body: bytes, send: Send, key: str) -> None:
+        start: Dict = {}
+        chunks: List[bytes] = []
+
+        async def replay_body() -> Message:
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def capture(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_body, capture)
+        except Exception:
+            await run_in_threadpool(idempotency.release, key)
+            raise
+        status_code = start.get("status", 500)
+        if status_code >= 500:
+            # Server errors may be transient, so let a retry run again
+            await run_in_threadpool(idempotency.release, key)
+            return
+        content_type = Headers(raw=start.get("headers", [])).get("content-type")
+        await run_in_threadpool(
+            idempotency.complete,
+            key,
+            StoredResponse(status_code, content_type, b"".join(chunks)),
+        )
+
+    @staticmethod
+    async def _read_body(receive: Receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+
 def setup_middleware(app: FastAPI) -> None:
     """Configure middleware for the application"""
+    app.add_middleware(IdempotencyMiddleware)
     app.add_middleware(RequestLoggingMiddleware)
@@ -0,0 +1,376 @@
+import asyncio
+import cProfile
+import functools
+import io
+import itertools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from fastapi import HTTPException
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# Profiler modes: periodic stack samples, folded for flame graphs, or
+# cProfile's deterministic per-function statistics
+SAMPLE = "sample"
+CPROFILE = "cprofile"
+MODES = (SAMPLE, CPROFILE)
+# Option returning the profile with the response, e.g. "X-Profile:
+# sample;inline", for when /profiles may be served by another worker
+INLINE = "inline"
+
+# Statements kept per profile; the rest are only counted
+MAX_STATEMENTS = 1000
+
+# Held by the one request cProfile may profile at a time: from Python
+# 3.12 a second enabled profiler raises "Another profiling tool is already
+# active". Requests asking while it's taken are sampled instead.
+_cprofile_lock = threading.Lock()
+
+current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar(
+    "current_profile", default=None
+)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class RequestProfile:
+    """
+    Profile of one request: the SQL it issued and where its time went.
+
+    Threads are sampled only while attached, which the endpoint does for
+    the thread it runs on. Dependencies run on other worker threads, so
+    their Python time is missing from the stacks, but their SQL is not.
+    """
+
+    def __init__(
+        self,
+        method: str,
+        path: str,
+        mode: str,
+        *,
+        sampled: bool = False,
+        inline: bool = False,
+    ) -> None:
+        # Held until stop(), so released only by profiles that get run
+        self._holds_cprofile = mode == CPROFILE and _cprofile_lock.acquire(blocking=False)
+        if mode == CPROFILE and not self._holds_cprofile:
+            metrics.inc("profiling.cprofile_busy")
+            mode = SAMPLE
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.mode = mode
+        # Picked by 1-in-N sampling rather than asked for
+        self.sampled = sampled
+        # Returned in the response body rather than only kept here
+        self.inline = inline
+        self.started_at = time.time()
+        self.duration: Optional[float] = None
+        self.status_code: Optional[int] = None
+        self.statements: List[Dict[str, Any]] = []
+        self.dropped_statements = 0
+        self.stacks: Counter = Counter()
+        self.stats: Optional[str] = None
+        self._lock = threading.Lock()
+        self._threads: Counter = Counter()
+        self._profiler = cProfile.Profile() if mode == CPROFILE else None
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._start = time.perf_counter()
+        if self.mode == SAMPLE:
+            self._sampler = threading.Thread(
+                target=self._sample, name=f"profile-{self.id[:8]}", daemon=True
+            )
+            self._sampler.start()
+
+    def stop(self) -> None:
+        self.duration = time.perf_counter() - self._start
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self._profiler is not None:
+            stream = io.StringIO()
+            stats = pstats.Stats(self._profiler, stream=stream)
+            stats.sort_stats("cumulative").print_stats(50)
+            self.stats = stream.getvalue()
+        if self._holds_cprofile:
+            self._holds_cprofile = False
+            _cprofile_lock.release()
+
+    @contextmanager
+    def attach(self) -> Iterator[None]:
+        """Include the calling thread while the block runs"""
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] += 1
+        # Before Python 3.12 a cProfile.Profile only sees the threads that
+        # enabled it. From 3.12 it sees every thread, so its statistics
+        # include whatever else the process ran meanwhile.
+        profiler = self._profiler
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            with self._lock:
+                self._threads[ident] -= 1
+                if not self._threads[ident]:
+                    del self._threads[ident]
+
+    def record_statement(self, statement: str, duration: float) -> None:
+        with self._lock:
+            if len(self.statements) < MAX_STATEMENTS:
+                self.statements.append(
+                    {"sql": statement, "duration_ms": round(duration * 1000, 3)}
+                )
+            else:
+                self.dropped_statements += 1
+
+    def _sample(self) -> None:
+        interval = settings.PROFILING_SAMPLE_INTERVAL_MS / 1000
+        own = threading.get_ident()
+        while not self._stop.wait(interval):
+            with self._lock:
+                threads = [ident for ident in self._threads if ident != own]
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            for ident in threads:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[_fold(frame)] += 1
+
+    def folded(self) -> str:
+        """Stacks in the folded format read by flamegraph.pl and speedscope"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "mode": self.mode,
+            "sampled": self.sampled,
+            "started_at": self.started_at,
+            "duration_ms": round((self.duration or 0) * 1000, 3),
+            "status_code": self.status_code,
+            "statement_count": len(self.statements) + self.dropped_statements,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **self.summary(),
+            "statements": list(self.statements),
+            "folded": self.folded(),
+            "stats": self.stats,
+        }
+
+
+def _fold(frame: Any) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        )
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class ProfileStore:
+    """Ring buffer of the most recent profiles"""
+
+    def __init__(self, max_entries: int) -> None:
+        self._profiles: deque = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def add(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._profiles.append(profile)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            return next((p for p in self._profiles if p.id == profile_id), None)
+
+    def list(self) -> List[RequestProfile]:
+        """Most recent first"""
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._profiles.clear()
+
+
+profiles = ProfileStore(settings.PROFILING_MAX_PROFILES)
+
+# Numbers requests for 1-in-N sampling; next() on it is thread-safe
+_request_counter = itertools.count()
+
+
+def _requested(request: Request) -> List[str]:
+    value = request.headers.get("x-profile") or request.query_params.get("profile")
+    return [part.strip() for part in value.split(";")] if value else []
+
+
+def requested_mode(request: Request) -> Optional[str]:
+    """The mode asked for with an X-Profile header or ?profile= flag"""
+    parts = _requested(request)
+    if not parts:
+        return None
+    return next((part for part in parts if part in MODES), SAMPLE)
+
+
+def requested_inline(request: Request) -> bool:
+    return INLINE in _requested(request)
+
+
+def _is_superuser(request: Request) -> bool:
+    # Imported here, as deps imports the session module, which imports the
+    # workload module that imports this one
+    from app.core import deps
+
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    token_data = deps.decode_token(token)
+    if token_data is None:
+        return False
+    get_db = request.app.dependency_overrides.get(deps.get_db, deps.get_db)
+    sessions = get_db()
+    db = next(sessions)
+    try:
+        deps.get_current_active_superuser(
+            deps.get_current_principal(db=db, token_data=token_data)
+        )
+    except HTTPException:
+        return False
+    finally:
+        sessions.close()
+    return True
+
+
+async def begin(request: Request) -> Optional[RequestProfile]:
+    """
+    A profile for this request, if a superuser asked for one or it was
+    picked for 1-in-N sampling. Flags from anyone else are ignored.
+    """
+    mode = requested_mode(request)
+    if mode is not None:
+        if await run_in_threadpool(_is_superuser, request):
+            return RequestProfile(
+                request.method, request.url.path, mode, inline=requested_inline(request)
+            )
+        metrics.inc("profiling.denied")
+    every = settings.PROFILING_SAMPLE_EVERY_N
+    if every > 0 and next(_request_counter) % every == 0:
+        return RequestProfile(request.method, request.url.path, SAMPLE, sampled=True)
+    return None
+
+
+async def run(
+    profile: RequestProfile, handler: Callable[[Request], Awaitable[Response]], request: Request
+) -> Response:
+    """
+    Run ``handler`` under ``profile``, then store it. An inline profile
+    also replaces the body with ``{"response": ..., "profile": ...}``.
+    """
+    token = current_profile.set(profile)
+    profile.start()
+    try:
+        response = await handler(request)
+        profile.status_code = response.status_code
+    finally:
+        current_profile.reset(token)
+        profile.stop()
+        profiles.add(profile)
+        metrics.inc(f"profiling.{profile.mode}")
+        logger.info(
+            f"Profiled {profile.method} {profile.path} ({profile.mode}) as {profile.id}"
+        )
+    if profile.inline and getattr(response, "body", None) is not None:
+        response = _with_profile(response, profile)
+    response.headers["X-Profile-Id"] = profile.id
+    return response
+
+
+def _with_profile(response: Response, profile: RequestProfile) -> Response:
+    body: Any = response.body.decode(response.charset, errors="replace")
+    if response.media_type == "application/json" and body:
+        body = json.loads(body)
+    headers = {
+        name: value
+        for name, value in response.headers.items()
+        if name not in ("content-length", "content-type")
+    }
+    return JSONResponse(
+        {"response": body, "profile": profile.to_dict()},
+        status_code=response.status_code,
+        headers=headers,
+    )
+
+
+def traced(endpoint: F) -> F:
+    """
+    Wrap an endpoint so the thread running it is attached to the current
+    profile. Costs a context variable lookup for requests not profiled.
+    """
+    if asyncio.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            profile = current_profile.get()
+            if profile is None:
+                return await endpoint(*args, **kwargs)
+            with profile.attach():
+                return await endpoint(*args, **kwargs)
+
+        return async_wrapper  # type: ignore[return-value]
+
+    @functools.wraps(endpoint)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        profile = current_profile.get()
+        if profile is None:
+            return endpoint(*args, **kwargs)
+        with profile.attach():
+            return endpoint(*args, **kwargs)
+
+    return wrapper  # type: ignore[return-value]
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile.get() is not None:
+        conn.info["profile_query_start"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    start = conn.info.pop("profile_query_start", None)
+    if profile is not None and start is not None:
+        profile.record_statement(statement, time.perf_counter() - start)
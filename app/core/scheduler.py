@@ -0,0 +1,241 @@
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from loguru import logger
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import NullPool
+
+from app.core.metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Which workers run a job: one across every host sharing the database, one
+# per host, e.g. for the logs directory, or every worker process, for state
+# held in process memory
+CLUSTER = "cluster"
+HOST = "host"
+PROCESS = "process"
+
+# pg_try_advisory_lock key claimed by the scheduler leader
+ADVISORY_LOCK_KEY = 0x5C4ED
+
+
+class Job(NamedTuple):
+    name: str
+    # Called with the monotonic time it should be finished by; batch jobs
+    # stop between batches once it has passed, and database jobs also
+    # bound each statement by it
+    fn: Callable[[float], Any]
+    interval: float
+    budget: float
+    scope: str = CLUSTER
+    # Run on the first tick rather than one interval after start-up
+    run_at_start: bool = False
+
+
+class LeaderLock:
+    """Held by at most one process at a time; never blocks"""
+
+    def acquire(self) -> bool:
+        """Try to take, or confirm we still hold, the lock"""
+        raise NotImplementedError
+
+    def release(self) -> None:
+        raise NotImplementedError
+
+
+class FileLeaderLock(LeaderLock):
+    """flock on a local file, shared by the worker processes on one host"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file: Optional[Any] = None
+
+    def acquire(self) -> bool:
+        if self._file is not None:
+            return True
+        if fcntl is None:
+            # No way to coordinate, so every process leads
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        lock_file = open(self.path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self) -> None:
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+class AdvisoryLeaderLock(LeaderLock):
+    """
+    PostgreSQL session advisory lock, shared by every host on the database.
+    Held on a connection of its own, outside the pools, which is checked on
+    every acquire so a dropped connection hands leadership over.
+    """
+
+    def __init__(self, url: str, key: int = ADVISORY_LOCK_KEY) -> None:
+        self.key = key
+        self._engine = create_engine(url, poolclass=NullPool)
+        self._connection: Optional[Connection] = None
+
+    def acquire(self) -> bool:
+        if self._connection is not None:
+            try:
+                self._connection.execute(text("SELECT 1"))
+                return True
+            except DBAPIError:
+                logger.warning("Lost the scheduler leader lock connection")
+                self._close()
+        connection = self._engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            acquired = connection.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}
+            ).scalar()
+        except DBAPIError:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        self._connection = connection
+        return True
+
+    def release(self) -> None:
+        if self._connection is not None:
+            try:
+                self._connection.execute(
+                    text("SELECT pg_advisory_unlock(:key)"), {"key": self.key}
+                )
+            finally:
+                self._close()
+        self._engine.dispose()
+
+    def _close(self) -> None:
+        try:
+            self._connection.close()
+        finally:
+            self._connection = None
+
+
+class Scheduler:
+    """
+    Runs periodic jobs off the request threadpool, one at a time per scope
+    on a thread for that scope, so a long cluster job never holds up the
+    per-process ones. Jobs scoped to a cluster or host only run while this
+    process holds the matching leader lock.
+
+    Each run is spaced ``interval`` plus up to ``jitter`` of it after the
+    previous one, which keeps workers and hosts from all running a job at
+    once. Run times go to ``scheduler.<job>`` in metrics, with counters for
+    runs, failures, runs over budget and runs skipped as a follower.
+    """
+
+    def __init__(
+        self,
+        jobs: List[Job],
+        leaders: Dict[str, LeaderLock],
+        *,
+        jitter: float = 0.1,
+        tick: float = 1.0,
+    ) -> None:
+        self.jobs = jobs
+        self.leaders = leaders
+        self.jitter = jitter
+        self.tick = tick
+        self._executors = {
+            scope: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"scheduler-{scope}")
+            for scope in {job.scope for job in jobs}
+        }
+        self._next_run: Dict[str, float] = {}
+        self._leading: Dict[str, bool] = {}
+        for scope in leaders:
+            metrics.register_gauge(
+                f"scheduler.leader.{scope}",
+                lambda scope=scope: float(self._leading.get(scope, False)),
+            )
+
+    def _delay(self, job: Job) -> float:
+        return job.interval * random.uniform(0, self.jitter)
+
+    def start(self) -> None:
+        now = time.monotonic()
+        for job in self.jobs:
+            if job.run_at_start:
+                self._next_run[job.name] = now
+            else:
+                self._next_run[job.name] = now + job.interval + self._delay(job)
+
+    async def run(self) -> None:
+        """Run due jobs until cancelled"""
+        self.start()
+        await asyncio.gather(*(self._run_scope(scope) for scope in self._executors))
+
+    async def _run_scope(self, scope: str) -> None:
+        loop = asyncio.get_running_loop()
+        jobs = [job for job in self.jobs if job.scope == scope]
+        while True:
+            now = time.monotonic()
+            for job in jobs:
+                if now < self._next_run[job.name]:
+                    continue
+                self._next_run[job.name] = now + job.interval + self._delay(job)
+                await loop.run_in_executor(self._executors[scope], self.run_job, job)
+            await asyncio.sleep(self.tick)
+
+    def run_job(self, job: Job) -> None:
+        if not self.is_leader(job.scope):
+            metrics.inc(f"scheduler.{job.name}.skipped")
+            return
+        start = time.monotonic()
+        try:
+            job.fn(start + job.budget)
+        except Exception as e:
+            metrics.inc(f"scheduler.{job.name}.failures")
+            logger.error(f"Scheduled job {job.name} failed: {str(e)}")
+            return
+        finally:
+            elapsed = time.monotonic() - start
+            metrics.observe(f"scheduler.{job.name}", elapsed)
+        metrics.inc(f"scheduler.{job.name}.runs")
+        if elapsed > job.budget:
+            metrics.inc(f"scheduler.{job.name}.over_budget")
+            logger.warning(
+                f"Scheduled job {job.name} took {elapsed:.1f}s, over its {job.budget:.0f}s budget"
+            )
+
+    def is_leader(self, scope: str) -> bool:
+        if scope == PROCESS:
+            return True
+        try:
+            leading = self.leaders[scope].acquire()
+        except Exception as e:
+            logger.error(f"Scheduler leader election failed: {str(e)}")
+            leading = False
+        if leading != self._leading.get(scope):
+            logger.info(f"Scheduler {'leads' if leading else 'follows'} for {scope} jobs")
+        self._leading[scope] = leading
+        return leading
+
+    def shutdown(self) -> None:
+        """Wait for running jobs, then give up leadership"""
+        for executor in self._executors.values():
+            executor.shutdown(wait=True)
+        for leader in {id(lock): lock for lock in self.leaders.values()}.values():
+            leader.release()
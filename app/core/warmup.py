@@ -0,0 +1,84 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Tuple
+
+from fastapi import FastAPI
+from fastapi.templating import Jinja2Templates
+from jose import jwt
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.security import ALGORITHM, create_access_token, get_password_hash
+
+
+def open_connections(engine: Engine, count: int) -> None:
+    """Open ``count`` pool connections in parallel and leave them pooled"""
+    # More than the pool keeps would be closed again, or, for pools without
+    # overflow, wait out the pool timeout
+    count = min(count, engine.pool.size())
+    if count <= 0:
+        return
+
+    def connect(_: int):
+        connection = engine.connect()
+        connection.execute(text("SELECT 1"))
+        return connection
+
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        connections = list(pool.map(connect, range(count)))
+    # Closing checks them back in, where the pool keeps them open
+    for connection in connections:
+        connection.close()
+
+
+def prime_security() -> None:
+    # Loads the bcrypt backend and runs its self-test
+    get_password_hash("warm-up")
+    token = create_access_token("0", claims={"ver": 0})
+    jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+
+
+def warm_up(
+    app: FastAPI,
+    templates: Jinja2Templates,
+    engines: Iterable[Engine],
+    tasks: Iterable[Tuple[str, Callable[[], object]]] = (),
+) -> None:
+    """
+    Do the work the first requests after a deploy would otherwise pay for,
+    then run ``tasks``, as (name, callable) pairs.
+    Each step is timed into metrics; a failing step is logged and skipped,
+    so a slow dependency can't keep the service from becoming ready.
+    """
+    engines = list(engines)
+    steps: List[tuple] = [
+        (
+            "pool",
+            lambda: [
+                open_connections(engine, settings.DB_WARMUP_CONNECTIONS)
+                for engine in engines
+            ],
+        ),
+        ("security", prime_security),
+        ("templates", lambda: templates.get_template("welcome.html")),
+        ("openapi", app.openapi),
+        *tasks,
+    ]
+    start = time.perf_counter()
+    for name, step in steps:
+        _run_step(name, step)
+    logger.info(f"Warm-up finished in {time.perf_counter() - start:.3f}s")
+
+
+def _run_step(name: str, step: Callable[[], object]) -> None:
+    start = time.perf_counter()
+    try:
+        step()
+    except Exception as e:
+        metrics.inc("warmup.failures")
+        logger.error(f"Warm-up step {name} failed: {str(e)}")
+        return
+    metrics.observe(f"warmup.{name}", time.perf_counter() - start)
@@ -0,0 +1,79 @@
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Type, TypeVar
+
+from fastapi.routing import APIRoute
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core import profiling
+from app.core.admission import busy_response, make_limiters
+
+# Workload classes, each with its own admission limit and connection pool
+# slice, so bulk traffic can't starve logins or interactive reads
+AUTH = "auth"
+INTERACTIVE = "interactive"
+BULK = "bulk"
+# Scheduled background jobs; never admitted through a route
+MAINTENANCE = "maintenance"
+
+current_workload: ContextVar[str] = ContextVar("current_workload", default=INTERACTIVE)
+
+limiters = make_limiters()
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def workload(name: str) -> Callable[[F], F]:
+    """Assign an endpoint to a workload class other than its router's"""
+
+    def decorator(endpoint: F) -> F:
+        endpoint.__workload__ = name
+        return endpoint
+
+    return decorator
+
+
+class WorkloadRoute(APIRoute):
+    """
+    Route that runs its endpoint as part of a workload class: admitted
+    through the class's limiter, with ``current_workload`` set so that
+    ``get_db`` hands out sessions from the class's pool slice. Admitted
+    requests can be profiled, see ``app.core.profiling``.
+    """
+
+    default_workload = INTERACTIVE
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        # Read by get_route_handler, which the base __init__ calls
+        self.workload = getattr(endpoint, "__workload__", self.default_workload)
+        super().__init__(path, profiling.traced(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable[[Request], Any]:
+        handler = super().get_route_handler()
+        name = self.workload
+
+        async def route_handler(request: Request) -> Response:
+            limiter = limiters.get(name)
+            if limiter is not None and not await limiter.acquire():
+                return busy_response(limiter.retry_after())
+            token = current_workload.set(name)
+            start = time.perf_counter()
+            try:
+                profile = await profiling.begin(request)
+                if profile is None:
+                    return await handler(request)
+                return await profiling.run(profile, handler, request)
+            finally:
+                current_workload.reset(token)
+                if limiter is not None:
+                    limiter.release(time.perf_counter() - start)
+
+        return route_handler
+
+
+def workload_route(default: str) -> Type[WorkloadRoute]:
+    """Route class for a router whose endpoints default to ``default``"""
+    return type(
+        f"{default.title()}WorkloadRoute", (WorkloadRoute,), {"default_workload": default}
+    )
@@ -2,3 +2,7 @@
 # imported by Alembic
 from app.db.session import Base
 from app.models.user import User
+from app.models.refresh_token import RefreshToken
+from app.models.user_directory import UserDirectory
+from app.models.archived_user import ArchivedUser
+from app.models.idempotency_key import IdempotencyKey
@@ -0,0 +1,83 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, Iterator, List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection, Engine
+
+# Tables whose planner statistics drift as they churn: users grows and
+# moves to the archive, tokens and idempotency keys expire in bulk
+MAINTAINED_TABLES = ("users", "users_archive", "refresh_tokens", "idempotency_keys")
+
+# Deadline of the maintenance job running on this thread
+_deadline: ContextVar[Optional[float]] = ContextVar("maintenance_deadline", default=None)
+
+
+def _timeout_ms(deadline: float) -> int:
+    # 0 would disable the timeout altogether
+    return max(1, int((deadline - time.monotonic()) * 1000))
+
+
+@contextmanager
+def time_budget(deadline: float) -> Iterator[None]:
+    """Bound every transaction begun in the block by ``deadline``"""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def enforce_deadlines(engine: Engine) -> None:
+    """
+    Have PostgreSQL cancel a statement on ``engine`` that would run past the
+    deadline of the ``time_budget`` it was issued in, so a single slow
+    statement can't overrun a job. Other databases have no such timeout.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+
+    @event.listens_for(engine, "begin")
+    def set_statement_timeout(connection: Connection) -> None:
+        deadline = _deadline.get()
+        if deadline is not None:
+            connection.exec_driver_sql(
+                f"SET LOCAL statement_timeout = {_timeout_ms(deadline)}"
+            )
+
+
+def analyze(engine: Engine, tables: Iterable[str], *, deadline: float) -> List[str]:
+    """
+    Refresh planner statistics for ``tables``, returning those done before
+    the ``time.monotonic()`` ``deadline``. On PostgreSQL a table still
+    running at the deadline is cancelled.
+
+    PostgreSQL also vacuums them, reclaiming rows left by deletes and
+    updates. SQLite only analyzes; its VACUUM rewrites the whole database
+    under an exclusive lock, which is no job for a running service.
+    """
+    if engine.dialect.name == "sqlite":
+        statement = "ANALYZE {}"
+    else:
+        statement = "VACUUM (ANALYZE) {}"
+    done = []
+    for table in tables:
+        if time.monotonic() >= deadline:
+            break
+        # VACUUM can't run inside a transaction. A connection per table
+        # also hands the SQLite writer lock back between tables.
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            if engine.dialect.name == "postgresql":
+                # Outside a transaction, so SET LOCAL wouldn't last
+                connection.exec_driver_sql(
+                    f"SET statement_timeout = {_timeout_ms(deadline)}"
+                )
+                try:
+                    connection.execute(text(statement.format(table)))
+                finally:
+                    connection.exec_driver_sql("RESET statement_timeout")
+            else:
+                connection.execute(text(statement.format(table)))
+        done.append(table)
+    return done
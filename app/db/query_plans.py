@@ -0,0 +1,121 @@
+"""
+Capture the plan of every query the services run.
+
+Run from the project root against the configured database:
+
+    python -m app.db.query_plans [--json]
+
+Each service call runs inside a transaction that is rolled back, so this is
+safe to point at a live database. The SQL it issues is recorded and passed
+to EXPLAIN (EXPLAIN QUERY PLAN on SQLite).
+"""
+import argparse
+import json
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.models.user import utcnow
+from app.services import archive as archive_service
+from app.services import change_feed
+from app.services import refresh_token as refresh_token_service
+from app.services import user as user_service
+from app.services.activity import ActivityBuffer
+
+
+def _flush_activity(db: Session) -> Any:
+    buffer = ActivityBuffer()
+    buffer.record_seen(1)
+    return buffer.flush(db)
+
+
+# Service calls to explain, with representative arguments
+SERVICE_QUERIES: Dict[str, Callable[[Session], Any]] = {
+    "user.get": lambda db: user_service.get(db, user_id=1),
+    "user.get_by_email": lambda db: user_service.get_by_email(
+        db, email="Someone@Example.com"
+    ),
+    "user.get_by_username": lambda db: user_service.get_by_username(
+        db, username="Someone"
+    ),
+    "user.get_many": lambda db: user_service.get_many(db, [1, 2, 3]),
+    "user.get_multi": lambda db: user_service.get_multi(db),
+    "user.get_multi_by_created_at": lambda db: user_service.get_multi(
+        db, sort="created_at"
+    ),
+    "refresh_token.rotate": lambda db: refresh_token_service.rotate(db, token="token"),
+    "refresh_token.prune_expired": lambda db: refresh_token_service.prune_expired(db),
+    "archive.archive_users": lambda db: archive_service.archive_users(db),
+    "activity.flush": _flush_activity,
+    "change_feed.get_changes": lambda db: change_feed.get_changes(
+        db, since=(utcnow(), 1)
+    ),
+}
+
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+def explain(connection: Connection, statement: str, parameters: Any) -> List[str]:
+    if isinstance(parameters, list):
+        # executemany: every row shares the plan
+        parameters = parameters[0]
+    if connection.dialect.name == "sqlite":
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[-1] for row in rows]
+    rows = connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+    return [row[0] for row in rows]
+
+
+def capture_plans(engine: Engine) -> Dict[str, List[Dict[str, Any]]]:
+    """Map each service call to the SQL it ran and the plan for each statement"""
+    plans: Dict[str, List[Dict[str, Any]]] = {}
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        db = Session(bind=connection, autoflush=False)
+        try:
+            for name, call in SERVICE_QUERIES.items():
+                statements: List[Any] = []
+
+                def record(conn, cursor, statement, parameters, context, executemany):
+                    if statement.lstrip().upper().startswith(_EXPLAINABLE):
+                        statements.append((statement, parameters))
+
+                event.listen(connection, "before_cursor_execute", record)
+                try:
+                    call(db)
+                finally:
+                    event.remove(connection, "before_cursor_execute", record)
+                plans[name] = [
+                    {"sql": statement, "plan": explain(connection, statement, parameters)}
+                    for statement, parameters in statements
+                ]
+        finally:
+            db.close()
+            transaction.rollback()
+    return plans
+
+
+def main() -> None:
+    from app.db.session import engine
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--json", action="store_true", help="print plans as JSON")
+    args = parser.parse_args()
+
+    plans = capture_plans(engine)
+    if args.json:
+        print(json.dumps(plans, indent=2))
+        return
+    for name, statements in plans.items():
+        print(f"== {name}")
+        for entry in statements:
+            print(" ".join(entry["sql"].split()))
+            for line in entry["plan"]:
+                print(f"    {line}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
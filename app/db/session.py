@@ -1,37 +1,109 @@
+from typing import Dict, List, Optional
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.engine.url import make_url
 
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.workload import INTERACTIVE, current_workload
+from app.db import sharding, sqlite
+
+
+def make_engine(
+    url: str, pool_size: Optional[int] = None, max_overflow: Optional[int] = None
+) -> Engine:
+    if pool_size is None:
+        pool_size = settings.DB_POOL_SIZE
+    if max_overflow is None:
+        max_overflow = settings.DB_MAX_OVERFLOW
+    if sqlite.is_sqlite_file(url):
+        return sqlite.make_engine(url, pool_size=pool_size, max_overflow=max_overflow)
+
+    # Configure engine with appropriate SSL settings for Neon PostgreSQL
+    connect_args = {}
+
+    # If using Neon PostgreSQL, ensure SSL settings are properly configured
+    if 'neon.tech' in str(url):
+        connect_args = {
+            "sslmode": "require",
+            "connect_timeout": 10
+        }
+
+    if make_url(url).get_driver_name() == "psycopg":
+        connect_args["prepare_threshold"] = settings.DB_PREPARE_THRESHOLD
+
+    return create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=300,
+        connect_args=connect_args
+    )
+
+
+def make_sessionmaker(engine: Engine, shard_engines: Dict[str, Engine]) -> sessionmaker:
+    if shard_engines:
+        return sharding.make_sessionmaker(engine, shard_engines)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
 
-# Configure engine with appropriate SSL settings for Neon PostgreSQL
-connect_args = {}
 url = settings.SQLALCHEMY_DATABASE_URI
+engine = make_engine(url)
+
+# With SHARD_DATABASE_URLS set, users live on the shards and the primary
+# database keeps the id directory and every other table
+shard_engines = {
+    f"shard{index}": make_engine(shard_url)
+    for index, shard_url in enumerate(settings.SHARD_DATABASE_URLS)
+}
+
+SessionLocal = make_sessionmaker(engine, shard_engines)
 
-# If using Neon PostgreSQL, ensure SSL settings are properly configured
-if 'neon.tech' in str(url):
-    connect_args = {
-        "sslmode": "require",
-        "connect_timeout": 10
+# Bulkheads: workload classes in WORKLOAD_POOL_SIZES get a fixed slice of
+# connections to every database, without overflow, so they can neither
+# borrow from nor starve the other classes
+workload_engines: Dict[str, List[Engine]] = {
+    INTERACTIVE: [engine, *shard_engines.values()]
+}
+workload_sessions: Dict[str, sessionmaker] = {INTERACTIVE: SessionLocal}
+for _name, _pool_size in settings.WORKLOAD_POOL_SIZES.items():
+    _engine = make_engine(url, pool_size=_pool_size, max_overflow=0)
+    _shards = {
+        f"shard{index}": make_engine(shard_url, pool_size=_pool_size, max_overflow=0)
+        for index, shard_url in enumerate(settings.SHARD_DATABASE_URLS)
     }
+    workload_engines[_name] = [_engine, *_shards.values()]
+    workload_sessions[_name] = make_sessionmaker(_engine, _shards)
+
+
+def _register_pool_gauges(name: str, engines: List[Engine]) -> None:
+    metrics.register_gauge(
+        f"workload.{name}.pool_checked_out",
+        lambda: sum(engine.pool.checkedout() for engine in engines),
+    )
+    metrics.register_gauge(
+        f"workload.{name}.pool_size",
+        lambda: sum(engine.pool.size() for engine in engines),
+    )
+
 
-engine = create_engine(
-    url, 
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
-    pool_recycle=300,
-    connect_args=connect_args
-)
+for _name, _engines in workload_engines.items():
+    _register_pool_gauges(_name, _engines)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+all_engines = [engine for engines in workload_engines.values() for engine in engines]
 
 Base = declarative_base()
 
 # Dependency
 def get_db():
-    db = SessionLocal()
+    # Classes without a pool slice of their own share the interactive pool
+    factory = workload_sessions.get(current_workload.get(), SessionLocal)
+    db = factory()
     try:
         yield db
     finally:
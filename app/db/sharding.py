@@ -0,0 +1,245 @@
+import heapq
+import itertools
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import Table, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.horizontal_shard import ShardedSession, set_shard_id
+from sqlalchemy.orm import ORMExecuteState, Session, sessionmaker
+from sqlalchemy.sql import Delete, Insert, Select, Update, operators, visitors
+from sqlalchemy.sql.elements import BindParameter
+from sqlalchemy.sql.functions import FunctionElement
+
+PRIMARY = "primary"
+
+# Tables spread over the shards, and the column holding the owning user id.
+# Everything else, including the user directory, stays on the primary.
+SHARDED_TABLES = {
+    "users": "id",
+    "users_archive": "id",
+    "refresh_tokens": "user_id",
+}
+
+
+class UserShardedSession(ShardedSession):
+    """ShardedSession that knows how users are spread over the shards"""
+
+    def __init__(self, *, user_shards: List[str], **kwargs: Any) -> None:
+        self.user_shards = user_shards
+        super().__init__(**kwargs)
+
+    def shard_for_user(self, user_id: int) -> str:
+        return self.user_shards[int(user_id) % len(self.user_shards)]
+
+
+def is_sharded(db: Session) -> bool:
+    return isinstance(db, UserShardedSession)
+
+
+def make_sessionmaker(primary: Engine, shards: Dict[str, Engine]) -> sessionmaker:
+    """
+    Build a session factory that routes user-owned rows by user id.
+
+    A user with id ``n`` lives on shard ``n % len(shards)``. Ids are
+    allocated globally by the user directory on the primary, which also
+    resolves username and email lookups to a shard.
+    """
+    user_shards = list(shards)
+
+    def shard_for_user(user_id: int) -> str:
+        return user_shards[int(user_id) % len(user_shards)]
+
+    def shard_chooser(mapper: Any, instance: Any, clause: Any = None) -> str:
+        key = SHARDED_TABLES.get(mapper.local_table.name) if mapper else None
+        if key is None:
+            return PRIMARY
+        if instance is not None and getattr(instance, key) is not None:
+            return shard_for_user(getattr(instance, key))
+        return user_shards[0]
+
+    def identity_chooser(mapper: Any, primary_key: Any, **kw: Any) -> List[str]:
+        key = SHARDED_TABLES.get(mapper.local_table.name)
+        if key is None:
+            return [PRIMARY]
+        if key == "id":
+            return [shard_for_user(primary_key[0])]
+        return list(user_shards)
+
+    def execute_chooser(orm_context: ORMExecuteState) -> List[str]:
+        if orm_context.is_select and orm_context.lazy_loaded_from is not None:
+            return [orm_context.lazy_loaded_from.identity_token]
+        statement = orm_context.statement
+        tables = [
+            table for table in _statement_tables(statement) if table in SHARDED_TABLES
+        ]
+        if not tables:
+            return [PRIMARY]
+        table = tables[0]
+        criteria = _equality_criteria(statement, table, orm_context.parameters)
+        user_ids = criteria.get(SHARDED_TABLES[table])
+        if user_ids is None and table == "users":
+            if "username" in criteria or "email" in criteria:
+                user_ids = _directory_lookup(orm_context.session, criteria)
+        if user_ids is None:
+            return list(user_shards)
+        chosen = list(dict.fromkeys(shard_for_user(user_id) for user_id in user_ids))
+        # Nothing can match, but the statement still needs somewhere to run
+        return chosen or [user_shards[0]]
+
+    return sessionmaker(
+        class_=UserShardedSession,
+        autocommit=False,
+        autoflush=False,
+        user_shards=user_shards,
+        shards={PRIMARY: primary, **shards},
+        shard_chooser=shard_chooser,
+        identity_chooser=identity_chooser,
+        execute_chooser=execute_chooser,
+    )
+
+
+def sharded_tables(tables: Dict[str, Table]) -> List[Table]:
+    """The tables to create on each shard, from ``Base.metadata.tables``"""
+    return [tables[name] for name in SHARDED_TABLES]
+
+
+def _statement_tables(statement: Any) -> List[str]:
+    if isinstance(statement, (Insert, Update, Delete)):
+        return [statement.table.name]
+    if isinstance(statement, Select):
+        return [
+            name
+            for name in (
+                getattr(from_, "name", None) for from_ in statement.get_final_froms()
+            )
+            if name
+        ]
+    return []
+
+
+def _equality_criteria(
+    statement: Any, table: str, parameters: Any
+) -> Dict[str, List[Any]]:
+    """
+    Collect ``column = value`` and ``column IN (...)`` criteria on ``table``.
+
+    Only conjunctive criteria are meaningful here; the service queries never
+    OR together lookups on different keys. ``lower(column)`` counts as the
+    column, since routing values are normalized anyway.
+    """
+    where = getattr(statement, "whereclause", None)
+    if where is None:
+        return {}
+    if isinstance(parameters, (list, tuple)):
+        parameters = parameters[0] if parameters else {}
+    parameters = parameters or {}
+    found: Dict[str, List[Any]] = {}
+
+    def visit_binary(binary: Any) -> None:
+        column, value = binary.left, binary.right
+        if isinstance(column, FunctionElement) and column.name == "lower":
+            column = list(column.clauses)[0]
+        if getattr(getattr(column, "table", None), "name", None) != table:
+            return
+        if not isinstance(value, BindParameter):
+            return
+        bound = value.effective_value
+        if bound is None:
+            bound = parameters.get(value.key)
+        if bound is None:
+            return
+        if binary.operator is operators.eq:
+            found.setdefault(column.name, []).append(bound)
+        elif binary.operator is operators.in_op:
+            found.setdefault(column.name, []).extend(bound)
+
+    visitors.traverse(where, {}, {"binary": visit_binary})
+    return found
+
+
+def _directory_lookup(db: Session, criteria: Dict[str, List[Any]]) -> List[int]:
+    # Imported here, as models import the session module which imports this
+    from app.models.user_directory import UserDirectory
+
+    stmt = select(UserDirectory.id)
+    if "username" in criteria:
+        stmt = stmt.where(
+            UserDirectory.username.in_([str(v).lower() for v in criteria["username"]])
+        )
+    if "email" in criteria:
+        stmt = stmt.where(
+            UserDirectory.email.in_([str(v).lower() for v in criteria["email"]])
+        )
+    return list(db.execute(stmt).scalars())
+
+
+def register_user(db: Session, user: Any) -> None:
+    """Allocate a globally unique id for a new user from the directory"""
+    from app.models.user_directory import UserDirectory
+
+    entry = UserDirectory(username=user.username.lower(), email=user.email.lower())
+    db.add(entry)
+    db.flush([entry])
+    user.id = entry.id
+
+
+def update_directory(db: Session, user_id: int, update_data: Dict[str, Any]) -> None:
+    from app.models.user_directory import UserDirectory
+
+    values = {
+        field: str(update_data[field]).lower()
+        for field in ("username", "email")
+        if update_data.get(field)
+    }
+    if values:
+        db.query(UserDirectory).filter(UserDirectory.id == user_id).update(values)
+
+
+def unregister_users(db: Session, user_ids: List[int]) -> None:
+    """Free the usernames and emails of archived users for reuse"""
+    from app.models.user_directory import UserDirectory
+
+    db.query(UserDirectory).filter(UserDirectory.id.in_(user_ids)).delete(
+        synchronize_session=False
+    )
+
+
+def reregister_user(db: Session, user: Any) -> None:
+    """Put a restored user back into the directory under its old id"""
+    from app.models.user_directory import UserDirectory
+
+    db.add(
+        UserDirectory(
+            id=user.id, username=user.username.lower(), email=user.email.lower()
+        )
+    )
+
+
+def for_each_shard(db: UserShardedSession) -> Iterable[Dict[str, str]]:
+    """Bind arguments for running a statement on every user shard in turn"""
+    return ({"shard_id": shard_id} for shard_id in db.user_shards)
+
+
+def merge_ordered(
+    db: UserShardedSession,
+    stmt: Select,
+    *,
+    key: Callable[[Any], Any],
+    skip: int,
+    limit: int,
+    params: Optional[Dict[str, Any]] = None,
+) -> List[Any]:
+    """
+    Run an ordered select on every shard and merge the results.
+
+    Each shard returns at most ``skip + limit`` rows in ``key`` order, which
+    is enough to produce the global page.
+    """
+    per_shard = [
+        db.execute(stmt.limit(skip + limit).options(set_shard_id(shard_id)), params)
+        .scalars()
+        .all()
+        for shard_id in db.user_shards
+    ]
+    merged = heapq.merge(*per_shard, key=key)
+    return list(itertools.islice(merged, skip, skip + limit))
@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# Statements after which pysqlite holds the database write lock until the
+# transaction ends
+_WRITES = ("INSERT", "UPDATE", "DELETE", "REPLACE", "CREATE", "DROP", "ALTER", "ANALYZE")
+
+
+def is_sqlite_file(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database not in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+class WriterLock:
+    """
+    Lets one connection at a time write to a SQLite database.
+
+    SQLite allows a single writer, and a connection that can't get the lock
+    waits out busy_timeout and then fails with "database is locked". Within
+    the process, writers instead queue here from their first write statement
+    until commit or rollback, while readers carry on concurrently under WAL.
+    The busy timeout still covers writers in other processes.
+    """
+
+    def __init__(self, timeout: float) -> None:
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def acquire(self, info: dict) -> None:
+        if info.get("sqlite_writer"):
+            return
+        start = time.perf_counter()
+        if not self._lock.acquire(timeout=self.timeout):
+            metrics.inc("sqlite.writer_timeouts")
+            raise sqlite3.OperationalError("database is locked (writer queue timeout)")
+        metrics.observe("sqlite.writer_wait", time.perf_counter() - start)
+        info["sqlite_writer"] = True
+
+    def release(self, info: dict) -> None:
+        if info.pop("sqlite_writer", False):
+            self._lock.release()
+
+
+# Engines on the same file, like per-workload pool slices, share one lock
+_writer_locks: Dict[str, WriterLock] = {}
+_writer_locks_lock = threading.Lock()
+
+
+def _writer_lock(url: str) -> WriterLock:
+    path = os.path.abspath(make_url(url).database)
+    with _writer_locks_lock:
+        if path not in _writer_locks:
+            _writer_locks[path] = WriterLock(
+                timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000
+            )
+        return _writer_locks[path]
+
+
+def make_engine(url: str, pool_size: int, max_overflow: int) -> Engine:
+    """
+    Engine for a file-backed SQLite database tuned for serving traffic:
+    WAL journaling so readers never block on the writer, a pool of reader
+    connections usable from any worker thread, and writes queued through
+    a process-wide writer lock.
+    """
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+    )
+    writer = _writer_lock(url)
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.close()
+
+    # pysqlite only opens a transaction right before the first write, so
+    # taking the lock here never leaves a stale read snapshot to upgrade
+    @event.listens_for(engine, "before_cursor_execute")
+    def queue_writer(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:7].upper().startswith(_WRITES):
+            writer.acquire(conn.info)
+
+    @event.listens_for(engine, "commit")
+    def release_on_commit(conn: Any) -> None:
+        writer.release(conn.info)
+
+    @event.listens_for(engine, "rollback")
+    def release_on_rollback(conn: Any) -> None:
+        writer.release(conn.info)
+
+    # Connections returned to the pool mid-transaction are rolled back
+    # without going through the Connection
+    @event.listens_for(engine, "reset")
+    def release_on_reset(
+        dbapi_connection: Any, connection_record: Any, reset_state: Any
+    ) -> None:
+        writer.release(connection_record.info)
+
+    @event.listens_for(engine, "close")
+    def release_on_close(dbapi_connection: Any, connection_record: Any) -> None:
+        writer.release(connection_record.info)
+
+    return engine
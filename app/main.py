@@ -1,15 +1,27 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
 
+from app.core.admission import busy_response
 from app.core.config import settings
-from app.core.logging import setup_logging
+from app.core.idempotency import DatabaseIdempotencyBackend, idempotency
+from app.core.logging import setup_logging, shutdown_logging
+from app.core.metrics import metrics
 from app.core.middleware import setup_middleware
+from app.core.warmup import warm_up
 from app.api.v1.api import api_router
-from app.db.session import engine
+from app.db import sharding
+from app.db.session import SessionLocal, all_engines, engine, shard_engines
 from app.db.base import Base
+from app.services.activity import activity
+from app.services.availability import availability
+from app.services.maintenance import make_scheduler
 
 
 # Setup logging
@@ -23,8 +35,20 @@ os.makedirs("logs", exist_ok=True)
 
 # Create tables in the database
 Base.metadata.create_all(bind=engine)
+for shard_engine in shard_engines.values():
+    Base.metadata.create_all(
+        bind=shard_engine, tables=sharding.sharded_tables(Base.metadata.tables)
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup()
+    yield
+    await shutdown()
+
 
 app = FastAPI(
+    lifespan=lifespan,
     title=settings.PROJECT_NAME,
     description="User Management API with FastAPI",
     version="1.0.0",
@@ -43,26 +67,96 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_headers=["*"],
     )
 
+# Share stored Idempotency-Key responses between workers
+if settings.IDEMPOTENCY_BACKEND == "database":
+    idempotency.set_backend(DatabaseIdempotencyBackend(SessionLocal))
+
 # Setup custom middleware
 setup_middleware(app)
 
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    # Every pooled connection stayed busy for DB_POOL_TIMEOUT seconds
+    metrics.inc("db.pool_timeouts")
+    return busy_response(retry_after=1)
+
 @app.get("/")
 def root(request: Request):
-    logger.info("Root endpoint accessed")
+    logger.debug("Root endpoint accessed")
     return templates.TemplateResponse("welcome.html", {"request": request, "message": "Welcome to the FastAPI application!"})
 
 @app.get("/health")
 def health_check():
-    logger.info("Health check endpoint accessed")
+    logger.debug("Health check endpoint accessed")
     return {"status": "healthy"}
 
-@app.on_event("startup")
-async def startup_event():
+@app.get("/ready")
+def readiness_check():
+    # Unlike /health, only succeeds once warm-up has finished
+    if not getattr(app.state, "ready", False):
+        return JSONResponse({"status": "warming up"}, status_code=503)
+    return {"status": "ready"}
+
+@app.get("/metrics")
+def read_metrics():
+    return metrics.snapshot()
+
+def flush_activity() -> None:
+    db = SessionLocal()
+    try:
+        activity.flush(db)
+    except Exception as e:
+        logger.error(f"Activity flush failed: {str(e)}")
+    finally:
+        db.close()
+
+
+def build_availability_filter() -> None:
+    db = SessionLocal()
+    try:
+        names = availability.rebuild(db)
+        logger.info(f"Built availability filter from {names} names")
+    finally:
+        db.close()
+
+
+async def run_warm_up() -> None:
+    await asyncio.get_running_loop().run_in_executor(
+        None,
+        warm_up,
+        app,
+        templates,
+        all_engines,
+        [("availability", build_availability_filter)],
+    )
+    app.state.ready = True
+
+
+async def startup():
     logger.info("Application startup")
+    app.state.ready = False
+    # Housekeeping, off the request path; jobs due at start run in the
+    # background so startup isn't held up by a large backlog
+    app.state.scheduler = make_scheduler()
+    app.state.scheduler_task = asyncio.create_task(app.state.scheduler.run())
+    # Serve /health meanwhile; /ready reports 503 until this finishes
+    app.state.warm_up = asyncio.create_task(run_warm_up())
+
 
-@app.on_event("shutdown")
-async def shutdown_event():
+async def shutdown():
+    app.state.ready = False
+    app.state.warm_up.cancel()
+    app.state.scheduler_task.cancel()
+    # Let a running job finish, and hand leadership to another worker
+    await asyncio.get_running_loop().run_in_executor(None, app.state.scheduler.shutdown)
+    # Don't lose timestamps buffered since the last periodic flush
+    await asyncio.get_running_loop().run_in_executor(None, flush_activity)
+    # Close pooled connections rather than leaving them to be dropped
+    for pool_engine in all_engines:
+        pool_engine.dispose()
     logger.info("Application shutdown")
+    # Drain records still queued for the background log writer
+    shutdown_logging()
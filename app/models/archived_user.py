@@ -0,0 +1,28 @@
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, String
+from app.db.session import Base
+from app.models.user import utcnow
+
+
+class ArchivedUser(Base):
+    """Cold storage for deleted and long-deactivated users"""
+
+    __tablename__ = "users_archive"
+
+    id = Column(Integer, primary_key=True)
+    email = Column(String(255), index=True, nullable=False)
+    username = Column(String(255), index=True, nullable=False)
+    hashed_password = Column(String(255), nullable=False)
+    first_name = Column(String(255), nullable=True)
+    last_name = Column(String(255), nullable=True)
+    is_active = Column(Boolean(), default=True)
+    is_superuser = Column(Boolean(), default=False)
+    token_version = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    last_login_at = Column(DateTime(timezone=True), nullable=True)
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
+    # Archived rows double as change feed tombstones, ordered by this
+    archived_at = Column(DateTime(timezone=True), default=utcnow)
+
+    __table_args__ = (Index("ix_users_archive_archived_at_id", archived_at, id),)
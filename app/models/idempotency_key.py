@@ -0,0 +1,18 @@
+from sqlalchemy import Column, DateTime, Integer, LargeBinary, String
+from sqlalchemy.sql import func
+from app.db.session import Base
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    # SHA-256 of the request method, path, credentials and Idempotency-Key
+    key = Column(String(64), primary_key=True)
+    # SHA-256 of the request body, to catch a key reused for another request
+    fingerprint = Column(String(64), nullable=False)
+    # Null while the original request is still being processed
+    status_code = Column(Integer, nullable=True)
+    content_type = Column(String(255), nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    expires_at = Column(DateTime(timezone=True), index=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
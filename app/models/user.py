@@ -1,12 +1,20 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime
+from datetime import datetime, timezone
+
+from sqlalchemy import Boolean, Column, Index, Integer, String, DateTime
 from sqlalchemy.sql import func
 from app.db.session import Base
 
 
+def utcnow() -> datetime:
+    # Set in Python rather than by the database, for microsecond precision
+    # on every backend; the change feed orders by these timestamps
+    return datetime.now(timezone.utc)
+
+
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     email = Column(String(255), unique=True, index=True, nullable=False)
     username = Column(String(255), unique=True, index=True, nullable=False)
     hashed_password = Column(String(255), nullable=False)
@@ -14,5 +22,41 @@ class User(Base):
     last_name = Column(String(255), nullable=True)
     is_active = Column(Boolean(), default=True)
     is_superuser = Column(Boolean(), default=False)
+    # Bumped whenever previously issued tokens must stop being accepted
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Set on insert too, so every user shows up in the change feed
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)
+    # Written in batches by the activity write-behind buffer
+    last_login_at = Column(DateTime(timezone=True), nullable=True)
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
+    # Set by a soft delete; the archival job later moves the row out
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Email and username lookups compare lower-cased values, so names
+        # must be unique that way too, not just as written
+        Index("ix_users_lower_email", func.lower(email), unique=True),
+        Index("ix_users_lower_username", func.lower(username), unique=True),
+        # Only deleted rows, so hot queries filtering on deleted_at IS NULL
+        # don't pick it over the index matching their lookup or order
+        Index(
+            "ix_users_deleted_at",
+            deleted_at,
+            sqlite_where=deleted_at.is_not(None),
+            postgresql_where=deleted_at.is_not(None),
+        ),
+        # Listing ordered by creation time
+        Index("ix_users_created_at_id", created_at, id),
+        # Change feed keyset pagination
+        Index("ix_users_updated_at_id", updated_at, id),
+        # Candidates for archival among deactivated users
+        Index(
+            "ix_users_inactive_since",
+            func.coalesce(updated_at, created_at),
+            sqlite_where=is_active.is_(False),
+            postgresql_where=is_active.is_(False),
+        ),
+        # Archived ids must never be handed out again
+        {"sqlite_autoincrement": True},
+    )
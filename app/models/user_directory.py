@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String
+from app.db.session import Base
+
+
+class UserDirectory(Base):
+    """
+    Global user id allocator and username/email index for sharded setups.
+    Lives on the primary database; names are stored lowercased.
+    """
+
+    __tablename__ = "user_directory"
+    # Never hand out a deleted user's id again
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True)
+    username = Column(String(255), unique=True, index=True, nullable=False)
+    email = Column(String(255), unique=True, index=True, nullable=False)
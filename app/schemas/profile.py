@@ -0,0 +1,29 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class ProfileStatement(BaseModel):
+    sql: str
+    duration_ms: float
+
+
+class ProfileSummary(BaseModel):
+    id: str
+    method: str
+    path: str
+    mode: str
+    # Picked by 1-in-N sampling rather than asked for
+    sampled: bool
+    started_at: float
+    duration_ms: float
+    status_code: Optional[int] = None
+    statement_count: int
+
+
+class Profile(ProfileSummary):
+    statements: List[ProfileStatement]
+    # Folded stacks, one "frame;frame;frame count" line each (sample mode)
+    folded: str
+    # cProfile statistics by cumulative time (cprofile mode)
+    stats: Optional[str] = None
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel, EmailStr, Field, validator
 from datetime import datetime
 
@@ -35,6 +35,9 @@ class UserInDBBase(UserBase):
     id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
+    last_login_at: Optional[datetime] = None
+    last_seen_at: Optional[datetime] = None
+    deleted_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -45,6 +48,39 @@ class User(UserInDBBase):
     pass
 
 
+# Batch lookup by id
+class UserBatchRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+
+class UserBatchItem(BaseModel):
+    id: int
+    status: Literal["found", "not_found", "forbidden"]
+    user: Optional[User] = None
+
+
+# Signup availability check; only the names asked about are included
+class UserAvailability(BaseModel):
+    username: Optional[bool] = None
+    email: Optional[bool] = None
+
+
+# Change feed
+class UserChange(BaseModel):
+    id: int
+    deleted: bool
+    changed_at: datetime
+    # Current state; omitted for deletes
+    user: Optional[User] = None
+
+
+class UserChangePage(BaseModel):
+    changes: List[UserChange]
+    # Pass back as ``since`` for the next page; unchanged when nothing is new
+    next_cursor: Optional[str] = None
+    has_more: bool
+
+
 # Additional properties stored in DB
 class UserInDB(UserInDBBase):
     hashed_password: str
@@ -54,8 +90,32 @@ class UserInDB(UserInDBBase):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
 
 
 # Token payload
 class TokenPayload(BaseModel):
     sub: Optional[int] = None
+    iat: Optional[int] = None
+    exp: Optional[int] = None
+    ver: int = 0
+    is_active: Optional[bool] = None
+    is_superuser: Optional[bool] = None
+
+
+# Batch token introspection
+class TokenIntrospectRequest(BaseModel):
+    tokens: List[str] = Field(..., min_length=1, max_length=1000)
+
+
+class TokenIntrospection(BaseModel):
+    # False for invalid, expired or revoked tokens, and for tokens of
+    # deleted or deactivated users; the other fields are then omitted
+    active: bool
+    sub: Optional[int] = None
+    is_superuser: Optional[bool] = None
+    exp: Optional[int] = None
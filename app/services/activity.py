@@ -0,0 +1,99 @@
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import DateTime, bindparam, func, update
+from sqlalchemy.orm import Session
+
+from app.core.metrics import metrics
+from app.db import sharding
+from app.models.user import User
+
+
+class ActivityBuffer:
+    """
+    Write-behind buffer for last_login_at / last_seen_at.
+
+    Timestamps are merged per user in memory and written by ``flush`` with a
+    single executemany UPDATE, so authenticated reads never write.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # user_id -> [last_login_at, last_seen_at]
+        self._pending: Dict[int, List[Optional[datetime]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record_login(self, user_id: int, at: Optional[datetime] = None) -> None:
+        at = at or datetime.now(timezone.utc)
+        self._merge(user_id, at, at)
+
+    def record_seen(self, user_id: int, at: Optional[datetime] = None) -> None:
+        self._merge(user_id, None, at or datetime.now(timezone.utc))
+
+    def _merge(
+        self, user_id: int, login_at: Optional[datetime], seen_at: Optional[datetime]
+    ) -> None:
+        with self._lock:
+            entry = self._pending.setdefault(user_id, [None, None])
+            if login_at and (entry[0] is None or login_at > entry[0]):
+                entry[0] = login_at
+            if seen_at and (entry[1] is None or seen_at > entry[1]):
+                entry[1] = seen_at
+
+    def flush(self, db: Session) -> int:
+        """Write buffered timestamps, returning the number of users updated"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        start = time.perf_counter()
+        users = User.__table__
+        stmt = (
+            update(users)
+            .where(users.c.id == bindparam("user_id"))
+            .values(
+                last_login_at=func.coalesce(
+                    bindparam("login_at", type_=DateTime(timezone=True)),
+                    users.c.last_login_at,
+                ),
+                last_seen_at=func.coalesce(
+                    bindparam("seen_at", type_=DateTime(timezone=True)),
+                    users.c.last_seen_at,
+                ),
+                # Activity isn't a profile change, so skip the onupdate bump
+                updated_at=users.c.updated_at,
+            )
+        )
+        params = [
+            {"user_id": user_id, "login_at": login_at, "seen_at": seen_at}
+            for user_id, (login_at, seen_at) in pending.items()
+        ]
+        try:
+            if sharding.is_sharded(db):
+                # One executemany per shard, each with only its own users
+                by_shard: Dict[str, List[Dict]] = {}
+                for entry in params:
+                    shard_id = db.shard_for_user(entry["user_id"])
+                    by_shard.setdefault(shard_id, []).append(entry)
+                for shard_id, shard_params in by_shard.items():
+                    db.execute(stmt, shard_params, bind_arguments={"shard_id": shard_id})
+            else:
+                db.execute(stmt, params)
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Put the timestamps back so the next flush retries them
+            for user_id, (login_at, seen_at) in pending.items():
+                self._merge(user_id, login_at, seen_at)
+            raise
+        metrics.observe("activity.flush", time.perf_counter() - start)
+        metrics.inc("activity.flushed_users", len(params))
+        return len(params)
+
+
+activity = ActivityBuffer()
+metrics.register_gauge("activity.buffer_size", lambda: len(activity))
@@ -0,0 +1,136 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import DateTime, and_, delete, func, insert, literal, or_, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db import sharding
+from app.models.archived_user import ArchivedUser
+from app.models.refresh_token import RefreshToken
+from app.models.user import User, utcnow
+
+# Columns copied between the hot and archive tables: those both have, so a
+# column added to only one doesn't break archival. test_archive checks
+# that every users column has an archive counterpart, so none is lost.
+_COLUMNS = [
+    column.name
+    for column in User.__table__.columns
+    if column.name in ArchivedUser.__table__.columns
+]
+
+
+def _bind(db: Session, user_id: int) -> Optional[Dict[str, str]]:
+    if sharding.is_sharded(db):
+        return {"shard_id": db.shard_for_user(user_id)}
+    return None
+
+
+def archive_users(
+    db: Session,
+    *,
+    older_than_days: Optional[int] = None,
+    batch_size: int = 500,
+    deadline: Optional[float] = None,
+) -> int:
+    """
+    Move users deleted, or deactivated, more than ``older_than_days`` ago
+    into the archive table, ``batch_size`` rows per transaction. Returns
+    the number of users archived. No new batch starts once the
+    ``time.monotonic()`` ``deadline`` passes.
+    """
+    if older_than_days is None:
+        older_than_days = settings.USER_ARCHIVE_AFTER_DAYS
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    if sharding.is_sharded(db):
+        return sum(
+            _archive_batches(db, cutoff, batch_size, deadline, bind_arguments)
+            for bind_arguments in sharding.for_each_shard(db)
+        )
+    return _archive_batches(db, cutoff, batch_size, deadline, None)
+
+
+def _archive_batches(
+    db: Session,
+    cutoff: datetime,
+    batch_size: int,
+    deadline: Optional[float],
+    bind_arguments: Optional[Dict[str, str]],
+) -> int:
+    users, archive = User.__table__, ArchivedUser.__table__
+    tokens = RefreshToken.__table__
+    cold = or_(
+        users.c.deleted_at < cutoff,
+        and_(
+            users.c.is_active.is_(False),
+            func.coalesce(users.c.updated_at, users.c.created_at) < cutoff,
+        ),
+    )
+    total = 0
+    while True:
+        ids = list(
+            db.execute(
+                select(users.c.id).where(cold).limit(batch_size),
+                bind_arguments=bind_arguments,
+            ).scalars()
+        )
+        if not ids:
+            return total
+        db.execute(
+            insert(archive).from_select(
+                [*_COLUMNS, "archived_at"],
+                select(
+                    *[users.c[name] for name in _COLUMNS],
+                    literal(utcnow(), DateTime(timezone=True)),
+                ).where(users.c.id.in_(ids)),
+            ),
+            bind_arguments=bind_arguments,
+        )
+        db.execute(delete(tokens).where(tokens.c.user_id.in_(ids)), bind_arguments=bind_arguments)
+        db.execute(delete(users).where(users.c.id.in_(ids)), bind_arguments=bind_arguments)
+        if bind_arguments is not None:
+            sharding.unregister_users(db, ids)
+        db.commit()
+        total += len(ids)
+        if len(ids) < batch_size:
+            return total
+        if deadline is not None and time.monotonic() >= deadline:
+            return total
+
+
+def get_archived(db: Session, *, user_id: int) -> Optional[ArchivedUser]:
+    return db.query(ArchivedUser).filter(ArchivedUser.id == user_id).first()
+
+
+def restore(db: Session, *, user_id: int) -> Optional[User]:
+    """
+    Undo a delete: clear ``deleted_at`` on a soft-deleted user, or move an
+    archived user back into the hot table first. Returns None if there is
+    nothing to restore.
+    """
+    user = db.query(User).filter(User.id == user_id).first()
+    if user is None:
+        if get_archived(db, user_id=user_id) is None:
+            return None
+        users, archive = User.__table__, ArchivedUser.__table__
+        bind_arguments = _bind(db, user_id)
+        db.execute(
+            insert(users).from_select(
+                _COLUMNS,
+                select(*[archive.c[name] for name in _COLUMNS]).where(archive.c.id == user_id),
+            ),
+            bind_arguments=bind_arguments,
+        )
+        db.execute(delete(archive).where(archive.c.id == user_id), bind_arguments=bind_arguments)
+        user = db.query(User).filter(User.id == user_id).first()
+        if bind_arguments is not None:
+            sharding.reregister_user(db, user)
+    user.deleted_at = None
+    # Even when nothing else changes, so feed consumers that saw the
+    # archive tombstone pick the user up again
+    user.updated_at = utcnow()
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
@@ -0,0 +1,153 @@
+import threading
+from datetime import timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db import sharding
+from app.models.user import User, utcnow
+from app.models.user_directory import UserDirectory
+from app.services import change_feed
+from app.utils.bloom import BloomFilter
+
+# Rows fetched per round trip while streaming the table
+_STREAM_BATCH_SIZE = 1000
+
+
+def _keys(username: Optional[str], email: Optional[str]) -> List[str]:
+    # Names are unique case-insensitively, as lookups compare lower-cased
+    keys = []
+    if username:
+        keys.append(f"username:{username.lower()}")
+    if email:
+        keys.append(f"email:{email.lower()}")
+    return keys
+
+
+class AvailabilityFilter:
+    """
+    Bloom filter of every username and email in use.
+
+    A miss means the name is definitely free; a hit only that it may be
+    taken, to be confirmed with a lookup. Names freed by renames and
+    archival stay in the filter, costing a lookup, until the next rebuild.
+    Until the first build every name may be taken.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._filter: Optional[BloomFilter] = None
+        # Names added while a rebuild streams the table
+        self._pending: Optional[List[str]] = None
+        # Change feed position other workers' changes are read from
+        self._cursor: Optional[change_feed.Cursor] = None
+
+    @property
+    def built(self) -> bool:
+        return self._filter is not None
+
+    def might_be_taken(self, *, username: Optional[str] = None, email: Optional[str] = None) -> bool:
+        bloom = self._filter
+        if bloom is None:
+            return True
+        return any(key in bloom for key in _keys(username, email))
+
+    def add(self, *, username: Optional[str] = None, email: Optional[str] = None) -> None:
+        self._add(_keys(username, email))
+
+    def _add(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            for key in keys:
+                if self._pending is not None:
+                    self._pending.append(key)
+                if self._filter is not None:
+                    self._filter.add(key)
+
+    def rebuild(self, db: Session) -> int:
+        """Build a fresh filter by streaming every name, returning its size"""
+        started = utcnow()
+        with self._lock:
+            self._pending = []
+        try:
+            count, rows = self._stream(db)
+            # Room for the users signing up until the next rebuild
+            bloom = BloomFilter(
+                max(2 * count, settings.AVAILABILITY_FILTER_MIN_CAPACITY),
+                settings.AVAILABILITY_FALSE_POSITIVE_RATE,
+            )
+            for username, email in rows:
+                for key in _keys(username, email):
+                    bloom.add(key)
+            with self._lock:
+                for key in self._pending:
+                    bloom.add(key)
+                self._filter = bloom
+                # Changes committed while streaming are picked up by catch_up
+                self._cursor = (
+                    started - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS),
+                    0,
+                )
+        finally:
+            with self._lock:
+                self._pending = None
+        metrics.inc("availability.rebuilds")
+        return len(bloom)
+
+    def _stream(self, db: Session) -> Tuple[int, Iterable[Tuple[str, str]]]:
+        # Sharded setups keep every name in the directory on the primary
+        model = UserDirectory if sharding.is_sharded(db) else User
+        count = db.execute(select(func.count()).select_from(model)).scalar_one()
+        rows = db.execute(
+            select(model.username, model.email).execution_options(
+                yield_per=_STREAM_BATCH_SIZE
+            )
+        )
+        return count, rows
+
+    def catch_up(self, db: Session) -> int:
+        """
+        Add names created or changed since the last build or catch-up,
+        including by other workers. Returns the number of changes read.
+        """
+        if self._cursor is None:
+            return 0
+        total, has_more = 0, True
+        while has_more:
+            changes, cursor, has_more = change_feed.get_changes(
+                db, since=self._cursor, limit=_STREAM_BATCH_SIZE
+            )
+            for change in changes:
+                if change.user is not None:
+                    self.add(username=change.user.username, email=change.user.email)
+            self._cursor = cursor
+            total += len(changes)
+        return total
+
+    def clear(self) -> None:
+        with self._lock:
+            self._filter = None
+            self._cursor = None
+
+    def size_bytes(self) -> int:
+        bloom = self._filter
+        return bloom.size_bytes if bloom is not None else 0
+
+    def items(self) -> int:
+        bloom = self._filter
+        return len(bloom) if bloom is not None else 0
+
+    def false_positive_rate(self) -> float:
+        """Expected false positive rate; the measured one is in the counters"""
+        bloom = self._filter
+        return bloom.false_positive_rate() if bloom is not None else 1.0
+
+
+availability = AvailabilityFilter()
+metrics.register_gauge("availability.filter_bytes", availability.size_bytes)
+metrics.register_gauge("availability.filter_items", availability.items)
+metrics.register_gauge(
+    "availability.expected_false_positive_rate", availability.false_positive_rate
+)
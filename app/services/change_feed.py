@@ -0,0 +1,104 @@
+import base64
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import DateTime, Integer, Select, bindparam, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db import sharding
+from app.models.archived_user import ArchivedUser
+from app.models.user import User, utcnow
+
+Cursor = Tuple[datetime, int]
+
+
+class Change(NamedTuple):
+    id: int
+    changed_at: datetime
+    deleted: bool
+    # None for deletes
+    user: Optional[User]
+
+
+def _feed(model: Any, changed_at: Any) -> Tuple[Select, Select]:
+    """Statements for a page from the start, and a page after a cursor"""
+    stmt = (
+        select(model)
+        .where(changed_at <= bindparam("upper", type_=DateTime(timezone=True)))
+        .order_by(changed_at, model.id)
+    )
+    after = stmt.where(
+        tuple_(changed_at, model.id)
+        > tuple_(
+            bindparam("since_at", type_=DateTime(timezone=True)),
+            bindparam("since_id", type_=Integer),
+        )
+    )
+    return stmt, after
+
+
+# Live and soft-deleted users by updated_at; once archived, a user's
+# archive row stands in as its tombstone
+_USERS = _feed(User, User.updated_at)
+_ARCHIVED = _feed(ArchivedUser, ArchivedUser.archived_at)
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    changed_at, user_id = cursor
+    raw = f"{changed_at.isoformat()}|{user_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Raises ValueError for anything ``encode_cursor`` didn't produce"""
+    try:
+        changed_at, user_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(changed_at), int(user_id)
+    except (UnicodeDecodeError, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def get_changes(
+    db: Session, *, since: Optional[Cursor] = None, limit: int = 100
+) -> Tuple[List[Change], Optional[Cursor], bool]:
+    """
+    Users created, updated or deleted after ``since``, oldest first.
+
+    Returns the page, the cursor to pass as ``since`` for the next one and
+    whether more changes are already waiting. Changes from the last
+    CHANGE_FEED_SETTLE_SECONDS are held back, so a transaction that commits
+    with a slightly older timestamp can't slip in behind a cursor already
+    handed out.
+    """
+    params: Dict[str, Any] = {
+        "upper": utcnow() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+    }
+    index = 0
+    if since is not None:
+        params.update(since_at=since[0], since_id=since[1])
+        index = 1
+    users = _fetch(db, _USERS[index], params, limit + 1, lambda u: (u.updated_at, u.id))
+    archived = _fetch(
+        db, _ARCHIVED[index], params, limit + 1, lambda a: (a.archived_at, a.id)
+    )
+    changes = [
+        Change(user.id, user.updated_at, user.deleted_at is not None, user)
+        for user in users
+    ] + [Change(entry.id, entry.archived_at, True, None) for entry in archived]
+    changes.sort(key=lambda change: (change.changed_at, change.id))
+    has_more = len(changes) > limit
+    page = [
+        change._replace(user=None) if change.deleted else change
+        for change in changes[:limit]
+    ]
+    next_cursor = (page[-1].changed_at, page[-1].id) if page else since
+    return page, next_cursor, has_more
+
+
+def _fetch(db: Session, stmt: Select, params: Dict[str, Any], limit: int, key: Any) -> List[Any]:
+    if sharding.is_sharded(db):
+        return sharding.merge_ordered(
+            db, stmt, key=key, skip=0, limit=limit, params=params
+        )
+    return list(db.execute(stmt.limit(limit), params).scalars())
@@ -0,0 +1,168 @@
+from typing import Callable, Dict, List
+
+from loguru import logger
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.idempotency import idempotency
+from app.core.logging import rotate_log_files
+from app.core.scheduler import (
+    CLUSTER,
+    HOST,
+    PROCESS,
+    AdvisoryLeaderLock,
+    FileLeaderLock,
+    Job,
+    LeaderLock,
+    Scheduler,
+)
+from app.core.workload import INTERACTIVE, MAINTENANCE
+from app.db import maintenance, sharding
+from app.db.session import SessionLocal, workload_engines, workload_sessions
+from app.services import archive as archive_service
+from app.services import refresh_token as refresh_token_service
+from app.services.activity import activity
+from app.services.availability import availability
+
+# Jobs run on a connection pool of their own, never the request pools
+_sessions = workload_sessions.get(MAINTENANCE, SessionLocal)
+_engines = workload_engines.get(MAINTENANCE) or workload_engines[INTERACTIVE]
+# PostgreSQL cancels a job's statements once its budget runs out
+for _engine in _engines:
+    maintenance.enforce_deadlines(_engine)
+
+
+def _with_session(fn: Callable[[Session], object], deadline: float) -> object:
+    db = _sessions()
+    try:
+        with maintenance.time_budget(deadline):
+            return fn(db)
+    finally:
+        db.close()
+
+
+def analyze_tables(deadline: float) -> None:
+    primary, *shards = _engines
+    done = maintenance.analyze(primary, maintenance.MAINTAINED_TABLES, deadline=deadline)
+    for shard in shards:
+        done += maintenance.analyze(shard, sharding.SHARDED_TABLES, deadline=deadline)
+    logger.info(f"Analyzed {len(done)} tables")
+
+
+def archive_users(deadline: float) -> None:
+    archived = _with_session(
+        lambda db: archive_service.archive_users(db, deadline=deadline),
+        deadline,
+    )
+    logger.info(f"Archived {archived} deleted or deactivated users")
+
+
+def prune_refresh_tokens(deadline: float) -> None:
+    pruned = _with_session(
+        lambda db: refresh_token_service.prune_expired(db, deadline=deadline),
+        deadline,
+    )
+    logger.info(f"Pruned {pruned} expired refresh tokens")
+
+
+def prune_idempotency_keys(deadline: float) -> None:
+    pruned = idempotency.backend.prune()
+    logger.info(f"Pruned {pruned} expired idempotency keys")
+
+
+def rotate_logs(deadline: float) -> None:
+    compressed, deleted = rotate_log_files(deadline=deadline)
+    logger.info(f"Compressed {compressed} and deleted {deleted} rotated log files")
+
+
+def flush_activity(deadline: float) -> None:
+    _with_session(activity.flush, deadline)
+
+
+def refresh_availability(deadline: float) -> None:
+    _with_session(availability.catch_up, deadline)
+
+
+def rebuild_availability(deadline: float) -> None:
+    _with_session(availability.rebuild, deadline)
+
+
+def make_jobs() -> List[Job]:
+    budget = settings.SCHEDULER_JOB_BUDGET_SECONDS
+    intervals = settings.SCHEDULER_INTERVALS
+    # The in-memory idempotency store is per process, the table shared
+    idempotency_scope = CLUSTER if settings.IDEMPOTENCY_BACKEND == "database" else PROCESS
+    jobs = [
+        Job("analyze", analyze_tables, intervals.get("analyze", 0), budget),
+        Job(
+            "archive_users",
+            archive_users,
+            intervals.get("archive_users", 0),
+            budget,
+            run_at_start=True,
+        ),
+        Job(
+            "prune_refresh_tokens",
+            prune_refresh_tokens,
+            intervals.get("prune_refresh_tokens", 0),
+            budget,
+            run_at_start=True,
+        ),
+        Job(
+            "prune_idempotency_keys",
+            prune_idempotency_keys,
+            intervals.get("prune_idempotency_keys", 0),
+            budget,
+            scope=idempotency_scope,
+            run_at_start=True,
+        ),
+        Job(
+            "rotate_logs",
+            rotate_logs,
+            intervals.get("rotate_logs", 0),
+            budget,
+            scope=HOST,
+            run_at_start=True,
+        ),
+        # Process state: every worker buffers its own activity and keeps
+        # its own availability filter
+        Job(
+            "flush_activity",
+            flush_activity,
+            settings.ACTIVITY_FLUSH_INTERVAL_SECONDS,
+            budget,
+            scope=PROCESS,
+        ),
+        Job(
+            "refresh_availability",
+            refresh_availability,
+            settings.AVAILABILITY_REFRESH_SECONDS,
+            budget,
+            scope=PROCESS,
+        ),
+        Job(
+            "rebuild_availability",
+            rebuild_availability,
+            settings.AVAILABILITY_REBUILD_SECONDS,
+            budget,
+            scope=PROCESS,
+        ),
+    ]
+    if not settings.SCHEDULER_ENABLED:
+        # Only the leader-elected maintenance is optional
+        jobs = [job for job in jobs if job.scope == PROCESS]
+    return [job for job in jobs if job.interval > 0]
+
+
+def make_leaders() -> Dict[str, LeaderLock]:
+    host = FileLeaderLock(settings.SCHEDULER_LOCK_FILE)
+    url = settings.SQLALCHEMY_DATABASE_URI
+    if make_url(url).get_backend_name() == "postgresql":
+        return {CLUSTER: AdvisoryLeaderLock(url), HOST: host}
+    # SQLite lives on one host, so its workers can elect through a file
+    return {CLUSTER: host, HOST: host}
+
+
+def make_scheduler() -> Scheduler:
+    return Scheduler(make_jobs(), make_leaders(), jitter=settings.SCHEDULER_JITTER)
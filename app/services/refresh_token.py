@@ -0,0 +1,131 @@
+import hashlib
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, select, true, update
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db import sharding
+from app.models.refresh_token import RefreshToken
+from app.models.user import User
+
+
+def hash_token(token: str) -> str:
+    # Refresh tokens are 256 bits of randomness, so a fast hash is enough
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _expires_at(now: datetime) -> datetime:
+    return now + timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES)
+
+
+def issue(db: Session, *, user: User) -> str:
+    token = secrets.token_urlsafe(32)
+    db.add(
+        RefreshToken(
+            token_hash=hash_token(token),
+            user_id=user.id,
+            token_version=user.token_version or 0,
+            expires_at=_expires_at(datetime.now(timezone.utc)),
+        )
+    )
+    db.commit()
+    return token
+
+
+def rotate(db: Session, *, token: str) -> Optional[Tuple[str, Row]]:
+    """
+    Swap a refresh token for a new one in a single UPDATE ... RETURNING.
+    Tokens live on their user's shard, so a sharded setup runs it per shard.
+
+    The update only matches an unexpired token whose user is still active
+    and has not bumped its token_version since issue. Returns the new token
+    and the user columns needed for the access token claims, or None.
+    """
+    new_token = secrets.token_urlsafe(32)
+    now = datetime.now(timezone.utc)
+    tokens, users = RefreshToken.__table__, User.__table__
+    # Correlated subqueries rather than UPDATE ... FROM, since SQLite can't
+    # RETURN columns of joined tables
+    user_matches = (
+        select(users.c.id)
+        .where(
+            users.c.id == tokens.c.user_id,
+            users.c.token_version == tokens.c.token_version,
+            users.c.is_active.is_(True),
+        )
+        .exists()
+    )
+    is_superuser = (
+        select(users.c.is_superuser)
+        .where(users.c.id == tokens.c.user_id)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(tokens)
+        .where(
+            tokens.c.token_hash == hash_token(token),
+            tokens.c.expires_at > now,
+            user_matches,
+        )
+        .values(token_hash=hash_token(new_token), expires_at=_expires_at(now))
+        .returning(
+            tokens.c.user_id.label("id"),
+            tokens.c.token_version,
+            # Guaranteed by the WHERE clause
+            true().label("is_active"),
+            is_superuser.label("is_superuser"),
+        )
+    )
+    row = db.execute(stmt).first()
+    db.commit()
+    if row is None:
+        return None
+    return new_token, row
+
+
+def prune_expired(
+    db: Session, *, batch_size: int = 1000, deadline: Optional[float] = None
+) -> int:
+    """
+    Delete expired refresh tokens in batches, returning how many went.
+    No new batch starts once the ``time.monotonic()`` ``deadline`` passes.
+    """
+    if sharding.is_sharded(db):
+        return sum(
+            _prune_expired(db, batch_size, deadline, bind_arguments)
+            for bind_arguments in sharding.for_each_shard(db)
+        )
+    return _prune_expired(db, batch_size, deadline, None)
+
+
+def _prune_expired(
+    db: Session,
+    batch_size: int,
+    deadline: Optional[float],
+    bind_arguments: Optional[Dict[str, str]],
+) -> int:
+    total = 0
+    while True:
+        expired_ids = (
+            select(RefreshToken.id)
+            .where(RefreshToken.expires_at <= datetime.now(timezone.utc))
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+        result = db.execute(
+            delete(RefreshToken)
+            .where(RefreshToken.id.in_(expired_ids))
+            .execution_options(synchronize_session=False),
+            bind_arguments=bind_arguments,
+        )
+        db.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+        if deadline is not None and time.monotonic() >= deadline:
+            return total
@@ -1,30 +1,231 @@
-from typing import Any, Dict, Optional, Union, List
-from sqlalchemy.orm import Session
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, NamedTuple, Optional, Sequence, Union, List
+from sqlalchemy import Select, bindparam, event, func, inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached
 
+from app.core.denylist import denylist
+from app.core.metrics import metrics
 from app.core.security import get_password_hash, verify_password
+from app.db import sharding
 from app.models.user import User
 from app.schemas.user import UserCreate, UserUpdate
+from app.services.availability import availability
+from app.utils.singleflight import SingleFlight
 
+# Keep IN lists well under SQLite's bound parameter limit
+IN_CLAUSE_CHUNK_SIZE = 500
 
-def get_by_email(db: Session, email: str) -> Optional[User]:
-    return db.query(User).filter(User.email == email).first()
+# Concurrent identical reads share one query
+_reads = SingleFlight("user_service")
 
+_COLUMN_KEYS = [attr.key for attr in inspect(User).column_attrs]
 
-def get_by_username(db: Session, username: str) -> Optional[User]:
-    return db.query(User).filter(User.username == username).first()
+# Set in session.info while the session's transaction has begun on a
+# connection; one merely autobegun by the ORM hasn't touched the database
+_DB_TRANSACTION = "user_service.db_transaction"
 
 
-def get(db: Session, user_id: int) -> Optional[User]:
-    return db.query(User).filter(User.id == user_id).first()
+@event.listens_for(Session, "after_begin")
+def _began_in_database(session: Session, transaction: Any, connection: Any) -> None:
+    session.info[_DB_TRANSACTION] = True
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _ended(session: Session, transaction: Any) -> None:
+    if transaction.parent is None:
+        session.info.pop(_DB_TRANSACTION, None)
+
+
+def _users(include_deleted: bool = False) -> Select:
+    # Soft-deleted users stay in the table until archived, but are
+    # invisible to every hot lookup
+    stmt = select(User)
+    return stmt if include_deleted else stmt.where(User.deleted_at.is_(None))
+
+
+# The hot lookups are built once, with bound parameters, so a call only
+# binds values: SQLAlchemy neither rebuilds the statement nor recomputes
+# its cache key, and goes straight to the cached compiled form
+_BY_ID = {
+    include_deleted: _users(include_deleted)
+    .where(User.id == bindparam("user_id"))
+    .limit(1)
+    for include_deleted in (False, True)
+}
+# lower() matches the expression indexes, so lookups are case-insensitive
+_BY_EMAIL = {
+    include_deleted: _users(include_deleted)
+    .where(func.lower(User.email) == bindparam("email"))
+    .limit(1)
+    for include_deleted in (False, True)
+}
+_BY_USERNAME = {
+    include_deleted: _users(include_deleted)
+    .where(func.lower(User.username) == bindparam("username"))
+    .limit(1)
+    for include_deleted in (False, True)
+}
+_BY_IDS = _users().where(User.id.in_(bindparam("user_ids", expanding=True)))
+
+
+def get_by_email(
+    db: Session, email: str, *, include_deleted: bool = False
+) -> Optional[User]:
+    return db.execute(
+        _BY_EMAIL[include_deleted], {"email": email.lower()}
+    ).scalars().first()
+
+
+def get_by_username(
+    db: Session, username: str, *, include_deleted: bool = False
+) -> Optional[User]:
+    return db.execute(
+        _BY_USERNAME[include_deleted], {"username": username.lower()}
+    ).scalars().first()
+
+
+def get(
+    db: Session, user_id: int, *, include_deleted: bool = False, coalesce: bool = True
+) -> Optional[User]:
+    """
+    Look a user up by id. ``coalesce=False`` always runs a query of its
+    own, as token authentication does, so credentials are checked against
+    the row as this session sees it.
+    """
+
+    def load() -> Optional[User]:
+        return db.execute(
+            _BY_ID[include_deleted], {"user_id": user_id}
+        ).scalars().first()
+
+    if not coalesce:
+        return load()
+    return _single_flight(db, ("get", user_id, include_deleted), load)
+
+
+def get_many(
+    db: Session, user_ids: Sequence[int], *, chunk_size: int = IN_CLAUSE_CHUNK_SIZE
+) -> List[Optional[User]]:
+    """
+    Fetch users by id with one IN query per chunk of distinct ids.
+    Results line up with ``user_ids``, with None for ids that don't exist.
+    """
+    distinct_ids = list(dict.fromkeys(user_ids))
+    found: Dict[int, User] = {}
+    for start in range(0, len(distinct_ids), chunk_size):
+        chunk = distinct_ids[start:start + chunk_size]
+        for user in db.execute(_BY_IDS, {"user_ids": chunk}).scalars():
+            found[user.id] = user
+    return [found.get(user_id) for user_id in user_ids]
+
+
+class _SortOrder(NamedTuple):
+    # Every live user in this order, for merging across shards
+    ordered: Select
+    # One page of it, with bound offset and limit
+    page: Select
+    key: Callable[[User], Any]
+
+
+def _sort_order(*columns: Any) -> _SortOrder:
+    ordered = _users().order_by(*columns)
+    return _SortOrder(
+        ordered,
+        ordered.offset(bindparam("skip")).limit(bindparam("limit")),
+        lambda user: tuple(getattr(user, column.key) for column in columns),
+    )
+
+
+# Listing orders, each backed by an index
+SORT_ORDERS = {
+    "id": _sort_order(User.id),
+    "created_at": _sort_order(User.created_at, User.id),
+}
 
 
 def get_multi(
-    db: Session, *, skip: int = 0, limit: int = 100
+    db: Session, *, skip: int = 0, limit: int = 100, sort: str = "id"
 ) -> List[User]:
-    return db.query(User).offset(skip).limit(limit).all()
+    return _single_flight(
+        db,
+        ("get_multi", skip, limit, sort),
+        lambda: _get_multi(db, skip=skip, limit=limit, sort=sort),
+    )
+
+
+def _get_multi(db: Session, *, skip: int, limit: int, sort: str) -> List[User]:
+    order = SORT_ORDERS[sort]
+    if sharding.is_sharded(db):
+        return sharding.merge_ordered(
+            db, order.ordered, key=order.key, skip=skip, limit=limit
+        )
+    return list(db.execute(order.page, {"skip": skip, "limit": limit}).scalars())
+
+
+def _single_flight(db: Session, key: tuple, load: Callable[[], Any]) -> Any:
+    """
+    Run ``load`` once for all concurrent callers with the same ``key`` on
+    the same database. Waiting callers get copies of the leader's rows in
+    their own session, so no instance is shared between sessions.
+
+    Only sessions with no open database transaction take part: one
+    already in a transaction may see its own uncommitted writes or an
+    older snapshot, neither of which may be handed to, or taken from,
+    another session.
+    """
+    if db.info.get(_DB_TRANSACTION) or db.new or db.dirty or db.deleted:
+        return load()
+    if sharding.is_sharded(db):
+        scope = db.get_bind(shard_id=sharding.PRIMARY)
+    else:
+        scope = db.get_bind()
+    # Snapshots are taken in the leader's thread, before it can change the
+    # instances, and only when another caller is waiting for them
+    result, shared = _reads.do((scope, *key), load, share=_snapshot)
+    return _rebuild(db, result) if shared else result
+
+
+def end_read_transaction(db: Session, *instances: User) -> None:
+    """
+    End the transaction of a session that has only read so far, so its
+    next reads can be coalesced again. ``instances`` stay loaded, where a
+    rollback would otherwise expire them and cost a query to reload.
+    """
+    if not db.info.get(_DB_TRANSACTION) or db.new or db.dirty or db.deleted:
+        return
+    for instance in instances:
+        db.expunge(instance)
+    db.rollback()
+    # Autobegins a transaction again, but not on a connection
+    for instance in instances:
+        db.add(instance)
+
+
+def _snapshot(result: Any) -> Any:
+    if result is None:
+        return None
+    if isinstance(result, list):
+        return [_snapshot(user) for user in result]
+    return {key: getattr(result, key) for key in _COLUMN_KEYS}
 
 
-def create(db: Session, *, obj_in: UserCreate) -> User:
+def _rebuild(db: Session, snapshot: Any) -> Any:
+    if snapshot is None:
+        return None
+    if isinstance(snapshot, list):
+        return [_rebuild(db, values) for values in snapshot]
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    if sharding.is_sharded(db):
+        # Sharded identities also name the shard the row was loaded from
+        state = inspect(user)
+        state.key = (*state.key[:2], db.shard_for_user(user.id))
+    return db.merge(user, load=False)
+
+
+def create(db: Session, *, obj_in: Union[UserCreate, Dict[str, Any]]) -> User:
+    if isinstance(obj_in, dict):
+        obj_in = UserCreate(**obj_in)
     db_obj = User(
         email=obj_in.email,
         username=obj_in.username,
@@ -33,6 +234,10 @@ def create(db: Session, *, obj_in: UserCreate) -> User:
         last_name=obj_in.last_name,
         is_superuser=obj_in.is_superuser,
     )
+    if sharding.is_sharded(db):
+        sharding.register_user(db, db_obj)
+    # Before committing, so the names never read as free once taken
+    availability.add(username=db_obj.username, email=db_obj.email)
     db.add(db_obj)
     db.commit()
     db.refresh(db_obj)
@@ -50,22 +255,81 @@ def update(
         hashed_password = get_password_hash(update_data["password"])
         del update_data["password"]
         update_data["hashed_password"] = hashed_password
+    revoke_tokens = _revokes_tokens(db_obj, update_data)
     for field in update_data:
         if field in update_data:
             setattr(db_obj, field, update_data[field])
+    if revoke_tokens:
+        db_obj.token_version = (db_obj.token_version or 0) + 1
+    if sharding.is_sharded(db):
+        sharding.update_directory(db, db_obj.id, update_data)
+    availability.add(username=update_data.get("username"), email=update_data.get("email"))
     db.add(db_obj)
     db.commit()
     db.refresh(db_obj)
+    if revoke_tokens:
+        denylist.revoke(db_obj.id, db_obj.token_version)
     return db_obj
 
 
 def delete(db: Session, *, user_id: int) -> User:
+    """
+    Soft-delete a user. The row leaves every hot lookup at once and is
+    moved to the archive table later by ``archive.archive_users``.
+    """
     obj = db.query(User).get(user_id)
-    db.delete(obj)
+    obj.deleted_at = datetime.now(timezone.utc)
+    # Also stops outstanding refresh tokens
+    obj.token_version = (obj.token_version or 0) + 1
+    db.add(obj)
     db.commit()
+    db.refresh(obj)
+    # Version-based, so a restored user can sign in again
+    denylist.revoke(user_id, obj.token_version)
     return obj
 
 
+def _revokes_tokens(user: User, update_data: Dict[str, Any]) -> bool:
+    """Whether an update invalidates the claims carried by issued tokens"""
+    if "hashed_password" in update_data:
+        return True
+    if "is_active" in update_data and not update_data["is_active"] and user.is_active:
+        return True
+    return (
+        "is_superuser" in update_data
+        and update_data["is_superuser"] != user.is_superuser
+    )
+
+
+def check_availability(
+    db: Session, *, username: Optional[str] = None, email: Optional[str] = None
+) -> Dict[str, bool]:
+    """
+    Whether each name given is free. Names the availability filter has
+    never seen are free without a query; only possible hits are looked up,
+    deleted users included since they keep their names until archived.
+    """
+    lookups = {"username": (username, get_by_username), "email": (email, get_by_email)}
+    result = {}
+    for field, (value, lookup) in lookups.items():
+        if value is None:
+            continue
+        if not availability.built:
+            # Not a filter answer, so kept out of the hit and false
+            # positive counts
+            result[field] = lookup(db, value, include_deleted=True) is None
+            continue
+        if not availability.might_be_taken(**{field: value}):
+            metrics.inc("availability.filter_misses")
+            result[field] = True
+            continue
+        metrics.inc("availability.filter_hits")
+        result[field] = lookup(db, value, include_deleted=True) is None
+        if result[field]:
+            metrics.inc("availability.false_positives")
+    return result
+
+
 def authenticate(db: Session, *, username: str, password: str) -> Optional[User]:
     user = get_by_username(db, username=username)
     if not user:
@@ -81,3 +345,11 @@ def is_active(user: User) -> bool:
 
 def is_superuser(user: User) -> bool:
     return user.is_superuser
+
+
+def token_claims(user: User) -> Dict[str, Any]:
+    return {
+        "ver": user.token_version or 0,
+        "is_active": bool(user.is_active),
+        "is_superuser": bool(user.is_superuser),
+    }
@@ -0,0 +1,99 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.denylist import denylist
+from app.core.idempotency import idempotency
+from app.core.profiling import profiles
+from app.db.session import Base, get_db
+from app.main import app
+from app.services.availability import availability
+from app.services import user as user_service
+
+
+# Use an in-memory SQLite database for testing
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+# Setup test database
+@pytest.fixture(scope="function")
+def db():
+    # Create the database and tables
+    Base.metadata.create_all(bind=engine)
+    
+    # Create a connection and session
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = TestingSessionLocal(bind=connection)
+    
+    # Begin a nested transaction
+    nested = connection.begin_nested()
+    
+    # Override the get_db dependency
+    def override_get_db():
+        try:
+            yield session
+        finally:
+            pass
+    
+    app.dependency_overrides[get_db] = override_get_db
+    
+    yield session
+    
+    # Rollback the transaction
+    session.close()
+    transaction.rollback()
+    connection.close()
+
+
+# Test client
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+# Create a test superuser
+@pytest.fixture(scope="function")
+def superuser(db):
+    user_in = {
+        "email": "admin@example.com",
+        "username": "admin",
+        "password": "admin123",
+        "is_superuser": True,
+    }
+    user = user_service.create(db, obj_in=user_in)
+    return user
+
+
+# Create a test normal user
+@pytest.fixture(scope="function")
+def normal_user(db):
+    user_in = {
+        "email": "user@example.com",
+        "username": "normaluser",
+        "password": "user123",
+        "is_superuser": False,
+    }
+    user = user_service.create(db, obj_in=user_in)
+    return user
+
+
+# Revocations, stored responses, the availability filter and profiles
+# are process-wide, so don't let them leak between tests
+@pytest.fixture(autouse=True)
+def clear_process_state():
+    denylist.backend.clear()
+    idempotency.backend.clear()
+    availability.clear()
+    profiles.clear()
+    yield
+    denylist.backend.clear()
+    idempotency.backend.clear()
+    availability.clear()
+    profiles.clear()
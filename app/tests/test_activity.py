@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+
+from app.core.config import settings
+from app.services.activity import ActivityBuffer
+
+
+# Test timestamps are merged per user and written in one flush
+def test_activity_flush(db, normal_user):
+    buffer = ActivityBuffer()
+    updated_at = normal_user.updated_at
+    login_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    buffer.record_login(normal_user.id, at=login_at)
+    buffer.record_seen(normal_user.id, at=login_at + timedelta(minutes=5))
+    buffer.record_seen(normal_user.id, at=login_at + timedelta(minutes=1))
+    assert len(buffer) == 1
+
+    assert buffer.flush(db) == 1
+    assert len(buffer) == 0
+
+    db.refresh(normal_user)
+    assert normal_user.last_login_at.replace(tzinfo=timezone.utc) == login_at
+    assert normal_user.last_seen_at.replace(tzinfo=timezone.utc) == (
+        login_at + timedelta(minutes=5)
+    )
+    # Activity doesn't count as a profile update
+    assert normal_user.updated_at == updated_at
+
+
+# Test a seen-only flush leaves last_login_at alone
+def test_activity_flush_seen_only(db, normal_user):
+    buffer = ActivityBuffer()
+    login_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    buffer.record_login(normal_user.id, at=login_at)
+    buffer.flush(db)
+
+    buffer.record_seen(normal_user.id, at=login_at + timedelta(days=1))
+    buffer.flush(db)
+
+    db.refresh(normal_user)
+    assert normal_user.last_login_at.replace(tzinfo=timezone.utc) == login_at
+
+
+# Test requests are buffered rather than written, and visible in metrics
+def test_activity_metrics(client, normal_user):
+    client.post(
+        f"{settings.API_V1_STR}/auth/login",
+        data={"username": "normaluser", "password": "user123"},
+    )
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.json()["gauges"]["activity.buffer_size"] >= 1
@@ -0,0 +1,145 @@
+import asyncio
+
+import httpx
+import pytest
+from pydantic import ValidationError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from fastapi import APIRouter, Depends, FastAPI
+
+from app.core.admission import AdmissionLimiter
+from app.core.config import Settings, settings
+from app.core.metrics import metrics
+from app.core.workload import (
+    AUTH,
+    BULK,
+    INTERACTIVE,
+    current_workload,
+    limiters,
+    workload,
+    workload_route,
+)
+from app.db.session import get_db, workload_engines
+
+
+# Test requests over the limit queue, and are shed once the queue is full or
+# they'd wait too long
+def test_limiter_queue_and_shed():
+    async def main():
+        limiter = AdmissionLimiter("test_admission", limit=1, queue_size=1, queue_timeout=0.1)
+        assert await limiter.acquire()
+        queued = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.queued == 1
+        assert not await limiter.acquire()
+
+        limiter.release(0.05)
+        assert await queued
+        assert limiter.in_flight == 1
+
+        assert not await limiter.acquire()
+        limiter.release(0.05)
+        assert limiter.in_flight == 0
+
+        # Requests are shed up front when the queue wouldn't drain in time
+        slow = AdmissionLimiter("test_admission", limit=1, queue_size=10, queue_timeout=0.1)
+        slow._service_time = 1.0
+        assert await slow.acquire()
+        assert not await slow.acquire()
+        assert slow.retry_after() == 1
+
+    before = metrics.snapshot()["counters"].get("admission.test_admission.shed", 0)
+    asyncio.run(main())
+    assert metrics.snapshot()["counters"]["admission.test_admission.shed"] == before + 3
+
+
+# Test each workload class is admitted through its own limiter, and its
+# endpoints and dependencies see the class
+def test_workload_routes(monkeypatch):
+    bulk = AdmissionLimiter("test_bulk", limit=1, queue_size=1, queue_timeout=0.05)
+    monkeypatch.setitem(limiters, BULK, bulk)
+
+    def seen_workload():
+        return current_workload.get()
+
+    router = APIRouter(route_class=workload_route(INTERACTIVE))
+
+    @router.get("/export")
+    @workload(BULK)
+    async def export(dependency: str = Depends(seen_workload)):
+        await asyncio.sleep(0.2)
+        return {"workload": current_workload.get(), "dependency": dependency}
+
+    @router.get("/me")
+    def me(dependency: str = Depends(seen_workload)):
+        return {"workload": current_workload.get(), "dependency": dependency}
+
+    app = FastAPI()
+    app.include_router(router, prefix="/users")
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(
+                *[client.get("/users/export") for _ in range(3)],
+                *[client.get("/users/me") for _ in range(3)],
+            )
+
+    responses = asyncio.run(main())
+    exports, reads = responses[:3], responses[3:]
+    assert sorted(response.status_code for response in exports) == [200, 503, 503]
+    assert all(
+        response.headers["Retry-After"] for response in exports if response.status_code == 503
+    )
+    ok = next(response for response in exports if response.status_code == 200)
+    assert ok.json() == {"workload": BULK, "dependency": BULK}
+    assert [response.json() for response in reads] == [
+        {"workload": INTERACTIVE, "dependency": INTERACTIVE}
+    ] * 3
+    assert bulk.in_flight == 0
+
+
+# Test sessions come from the pool slice of the current workload class
+def test_get_db_uses_workload_pool():
+    for name in (AUTH, BULK, INTERACTIVE):
+        token = current_workload.set(name)
+        try:
+            db = next(get_db())
+            assert db.get_bind() is workload_engines[name][0]
+            db.close()
+        finally:
+            current_workload.reset(token)
+    assert workload_engines[BULK][0].pool.size() == settings.WORKLOAD_POOL_SIZES[BULK]
+
+
+# Test a pool checkout timeout becomes a 503 instead of a 500
+def test_pool_timeout_is_503(client):
+    def exhausted_pool():
+        raise PoolTimeoutError("QueuePool limit reached")
+        yield
+
+    client.app.dependency_overrides[get_db] = exhausted_pool
+    try:
+        response = client.post(
+            f"{settings.API_V1_STR}/auth/login",
+            data={"username": "admin", "password": "admin123"},
+        )
+    finally:
+        del client.app.dependency_overrides[get_db]
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+# Test an admission limit larger than its pool slice is rejected
+def test_admission_limits_fit_pools():
+    for name, limit in settings.ADMISSION_LIMITS.items():
+        pool = settings.WORKLOAD_POOL_SIZES.get(
+            name, settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+        )
+        assert limit <= pool
+
+    with pytest.raises(ValidationError, match="auth"):
+        Settings(
+            DATABASE_URL="sqlite://",
+            ADMISSION_LIMITS={"auth": 6},
+            WORKLOAD_POOL_SIZES={"auth": 5},
+        )
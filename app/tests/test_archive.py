@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.archived_user import ArchivedUser
+from app.models.user import User
+from app.services import archive as archive_service
+from app.services import user as user_service
+
+
+def create_user(db: Session, name: str) -> User:
+    return user_service.create(
+        db,
+        obj_in={
+            "email": f"{name}@example.com",
+            "username": name,
+            "password": "secret123",
+        },
+    )
+
+
+# Test a deleted user disappears from lookups but keeps its row
+def test_soft_delete(db: Session):
+    user = create_user(db, "softdeleted")
+    user_service.delete(db, user_id=user.id)
+
+    assert user_service.get(db, user_id=user.id) is None
+    assert user_service.get_by_username(db, username="softdeleted") is None
+    assert user_service.get_many(db, [user.id]) == [None]
+    assert user.id not in [u.id for u in user_service.get_multi(db, limit=1000)]
+    assert user_service.get(db, user_id=user.id, include_deleted=True).deleted_at
+
+
+# Test archival moves only cold users, in batches
+def test_archive_users(db: Session):
+    ids = [create_user(db, f"cold{index}").id for index in range(3)]
+    active = create_user(db, "warm").id
+    recent = create_user(db, "recentlydeleted").id
+    for user_id in [*ids, recent]:
+        user_service.delete(db, user_id=user_id)
+    cutoff = datetime.now(timezone.utc) - timedelta(days=10)
+    db.query(User).filter(User.id.in_(ids)).update(
+        {User.deleted_at: cutoff}, synchronize_session=False
+    )
+    db.commit()
+
+    assert archive_service.archive_users(db, older_than_days=5, batch_size=2) == 3
+    assert db.query(User).filter(User.id.in_(ids)).count() == 0
+    assert db.query(ArchivedUser).filter(ArchivedUser.id.in_(ids)).count() == 3
+    assert user_service.get(db, user_id=active)
+    assert user_service.get(db, user_id=recent, include_deleted=True)
+
+
+# Test restoring both soft-deleted and archived users through the API
+def test_restore_user(client: TestClient, superuser: User, db: Session):
+    archived = create_user(db, "restorearchived").id
+    user_service.delete(db, user_id=archived)
+    archive_service.archive_users(db, older_than_days=0)
+    soft = create_user(db, "restoresoft").id
+    user_service.delete(db, user_id=soft)
+    assert user_service.get(db, user_id=archived, include_deleted=True) is None
+
+    login_data = {"username": superuser.username, "password": "admin123"}
+    response = client.post(f"{settings.API_V1_STR}/auth/login", data=login_data)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    for user_id in (soft, archived):
+        response = client.post(
+            f"{settings.API_V1_STR}/users/{user_id}/restore", headers=headers
+        )
+        assert response.status_code == 200
+        assert response.json()["deleted_at"] is None
+        assert user_service.get(db, user_id=user_id)
+
+    response = client.post(
+        f"{settings.API_V1_STR}/users/{soft}/restore", headers=headers
+    )
+    assert response.status_code == 400
+
+
+# Test the archive table keeps every users column, so archival loses nothing
+def test_archive_has_every_user_column():
+    users = {column.name for column in User.__table__.columns}
+    archive = {column.name for column in ArchivedUser.__table__.columns}
+    assert users <= archive
+    assert archive - users == {"archived_at"}
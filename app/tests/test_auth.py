@@ -0,0 +1,170 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.core.denylist import MemoryDenylistBackend, TokenDenylist
+from app.models.refresh_token import RefreshToken
+from app.services import refresh_token as refresh_token_service
+from app.services import user as user_service
+
+
+def login(client, username, password):
+    response = client.post(
+        f"{settings.API_V1_STR}/auth/login",
+        data={"username": username, "password": password},
+    )
+    return response.json()["access_token"]
+
+
+# Test that a password change revokes previously issued tokens
+def test_password_change_revokes_token(client, normal_user, db):
+    token = login(client, "normaluser", "user123")
+
+    user_service.update(db, db_obj=normal_user, obj_in={"password": "changed123"})
+
+    response = client.get(
+        f"{settings.API_V1_STR}/users/me",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 403
+
+    token = login(client, "normaluser", "changed123")
+    response = client.get(
+        f"{settings.API_V1_STR}/users/me",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+
+
+# Test superuser checks run from token claims in stateless mode
+def test_stateless_superuser_revoked_on_demotion(client, superuser, db, monkeypatch):
+    monkeypatch.setattr(settings, "STATELESS_AUTH", True)
+    token = login(client, "admin", "admin123")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get(f"{settings.API_V1_STR}/users/", headers=headers)
+    assert response.status_code == 200
+
+    user_service.update(db, db_obj=superuser, obj_in={"is_superuser": False})
+
+    response = client.get(f"{settings.API_V1_STR}/users/", headers=headers)
+    assert response.status_code == 403
+
+
+# Test the denylist stays bounded without re-admitting evicted revocations
+def test_denylist_eviction_raises_watermark():
+    denylist = TokenDenylist(MemoryDenylistBackend(max_entries=2))
+    denylist.revoke(1, 1)
+    denylist.revoke(2, 1)
+    denylist.revoke(3, 1)
+
+    assert len(denylist.backend) == 2
+    assert denylist.backend.issued_before() > 0
+    # Token for the evicted user issued before the revocation is still rejected
+    assert denylist.is_revoked(1, 0, issued_at=denylist.backend.issued_before() - 1)
+    assert denylist.is_revoked(3, 0)
+    assert not denylist.is_revoked(3, 1)
+
+
+# Test refresh tokens rotate and can only be used once
+def test_refresh_token_rotation(client, normal_user):
+    response = client.post(
+        f"{settings.API_V1_STR}/auth/login",
+        data={"username": "normaluser", "password": "user123"},
+    )
+    refresh_token = response.json()["refresh_token"]
+
+    response = client.post(
+        f"{settings.API_V1_STR}/auth/refresh",
+        json={"refresh_token": refresh_token},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["refresh_token"] != refresh_token
+
+    response = client.get(
+        f"{settings.API_V1_STR}/users/me",
+        headers={"Authorization": f"Bearer {data['access_token']}"},
+    )
+    assert response.status_code == 200
+
+    # The consumed token can't be replayed
+    response = client.post(
+        f"{settings.API_V1_STR}/auth/refresh",
+        json={"refresh_token": refresh_token},
+    )
+    assert response.status_code == 400
+
+
+# Test a password change invalidates outstanding refresh tokens
+def test_refresh_token_revoked_by_password_change(client, normal_user, db):
+    response = client.post(
+        f"{settings.API_V1_STR}/auth/login",
+        data={"username": "normaluser", "password": "user123"},
+    )
+    refresh_token = response.json()["refresh_token"]
+
+    user_service.update(db, db_obj=normal_user, obj_in={"password": "changed123"})
+
+    response = client.post(
+        f"{settings.API_V1_STR}/auth/refresh",
+        json={"refresh_token": refresh_token},
+    )
+    assert response.status_code == 400
+
+
+# Test expired refresh tokens are pruned in batches
+def test_prune_expired_refresh_tokens(normal_user, db):
+    for _ in range(5):
+        refresh_token_service.issue(db, user=normal_user)
+    db.query(RefreshToken).update(
+        {RefreshToken.expires_at: datetime.now(timezone.utc) - timedelta(minutes=1)}
+    )
+    db.commit()
+
+    assert refresh_token_service.prune_expired(db, batch_size=2) == 5
+    assert db.query(RefreshToken).count() == 0
+
+
+# Test a batch of tokens is checked with a single user query
+def test_introspect_tokens(client, superuser, normal_user, db):
+    admin_token = login(client, "admin", "admin123")
+    revoked = login(client, "normaluser", "user123")
+    user_service.update(db, db_obj=normal_user, obj_in={"password": "changed123"})
+    token = login(client, "normaluser", "changed123")
+    expired = create_access_token(normal_user.id, expires_delta=timedelta(minutes=-1))
+    tokens = [token, admin_token, revoked, "not-a-token", expired, token]
+
+    statements = []
+    engine = db.get_bind().engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        response = client.post(
+            f"{settings.API_V1_STR}/auth/introspect",
+            json={"tokens": tokens},
+            headers={"Authorization": f"Bearer {admin_token}"},
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert response.status_code == 200
+    results = response.json()
+    assert results[0] == {
+        "active": True,
+        "sub": normal_user.id,
+        "is_superuser": False,
+        "exp": results[0]["exp"],
+    }
+    assert results[1]["is_superuser"] is True
+    assert results[2:5] == [{"active": False}] * 3
+    assert results[5] == results[0]
+    assert len([s for s in statements if " IN (" in s and "FROM users" in s]) == 1
+
+    response = client.post(
+        f"{settings.API_V1_STR}/auth/introspect",
+        json={"tokens": [token]},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 400
@@ -0,0 +1,98 @@
+import time
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.security import get_password_hash
+from app.models.user import User
+from app.services import user as user_service
+from app.services.availability import availability
+from app.utils.bloom import BloomFilter
+
+
+def wait_until_ready(client):
+    # Warm-up builds the filter from the app database; let it finish first
+    deadline = time.monotonic() + 10
+    while client.get("/ready").status_code == 503 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    availability.clear()
+
+
+def counter(name):
+    return metrics.snapshot()["counters"].get(name, 0)
+
+
+# Test the filter has no false negatives and about the configured error rate
+def test_bloom_filter():
+    bloom = BloomFilter(1000, 0.01)
+    for index in range(1000):
+        bloom.add(f"member{index}")
+
+    assert all(f"member{index}" in bloom for index in range(1000))
+    false_positives = sum(f"other{index}" in bloom for index in range(10000))
+    assert false_positives < 300
+    assert len(bloom) == 1000
+    assert bloom.size_bytes < 2000
+    assert 0.005 < bloom.false_positive_rate() < 0.02
+
+
+# Test free names are answered by the filter and taken ones by a lookup
+def test_availability_endpoint(client, db: Session):
+    wait_until_ready(client)
+    user_service.create(
+        db, obj_in={"email": "Taken@example.com", "username": "Taken", "password": "secret123"}
+    )
+    availability.rebuild(db)
+    url = f"{settings.API_V1_STR}/users/availability"
+
+    misses = counter("availability.filter_misses")
+    response = client.get(url, params={"username": "free", "email": "free@example.com"})
+    assert response.json() == {"username": True, "email": True}
+    assert counter("availability.filter_misses") == misses + 2
+
+    hits = counter("availability.filter_hits")
+    response = client.get(url, params={"username": "taken"})
+    assert response.json() == {"username": False}
+    assert counter("availability.filter_hits") == hits + 1
+
+    # Taken as soon as a user is created, without a rebuild
+    user_service.create(
+        db, obj_in={"email": "new@example.com", "username": "newname", "password": "secret123"}
+    )
+    response = client.get(url, params={"email": "NEW@example.com"})
+    assert response.json() == {"email": False}
+
+    assert client.get(url).status_code == 400
+
+
+# Test lookups before the filter is built stay out of its counters
+def test_availability_before_build(db: Session, normal_user):
+    availability.clear()
+    names = ["availability.filter_hits", "availability.false_positives"]
+    before = [counter(name) for name in names]
+
+    assert user_service.check_availability(db, username="free") == {"username": True}
+    assert user_service.check_availability(db, username="normaluser") == {"username": False}
+    assert [counter(name) for name in names] == before
+
+
+# Test names taken through another worker are read from the change feed
+def test_catch_up(db: Session, monkeypatch):
+    monkeypatch.setattr(settings, "CHANGE_FEED_SETTLE_SECONDS", 0)
+    availability.rebuild(db)
+    db.add(
+        User(
+            email="elsewhere@example.com",
+            username="elsewhere",
+            hashed_password=get_password_hash("secret123"),
+        )
+    )
+    db.commit()
+    assert not availability.might_be_taken(username="elsewhere")
+
+    assert availability.catch_up(db) == 1
+    assert availability.might_be_taken(username="elsewhere")
+    assert user_service.check_availability(db, email="elsewhere@example.com") == {
+        "email": False
+    }
@@ -0,0 +1,85 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.user import User, utcnow
+from app.services import archive as archive_service
+from app.services import change_feed
+from app.services import user as user_service
+
+
+@pytest.fixture(autouse=True)
+def no_settle_window(monkeypatch):
+    monkeypatch.setattr(settings, "CHANGE_FEED_SETTLE_SECONDS", 0)
+
+
+def create_user(db: Session, name: str) -> User:
+    return user_service.create(
+        db,
+        obj_in={
+            "email": f"{name}@example.com",
+            "username": name,
+            "password": "secret123",
+        },
+    )
+
+
+# Test creates, updates and deletes come back in order, a page at a time
+def test_get_changes(db: Session):
+    since = (utcnow(), 0)
+    first, second, third = (create_user(db, f"feed{index}") for index in range(3))
+    ids = (first.id, second.id, third.id)
+    user_service.update(db, db_obj=first, obj_in={"first_name": "Changed"})
+    user_service.delete(db, user_id=second.id)
+
+    page, since, has_more = change_feed.get_changes(db, since=since, limit=2)
+    assert [change.id for change in page] == [ids[2], ids[0]]
+    assert page[1].user.first_name == "Changed"
+    assert has_more
+
+    page, since, has_more = change_feed.get_changes(db, since=since, limit=2)
+    assert [(change.id, change.deleted, change.user) for change in page] == [
+        (ids[1], True, None)
+    ]
+    assert not has_more
+
+    assert change_feed.get_changes(db, since=since) == ([], since, False)
+
+
+# Test changes still settling are held back
+def test_settle_window(db: Session, monkeypatch):
+    since = (utcnow(), 0)
+    create_user(db, "settling")
+    monkeypatch.setattr(settings, "CHANGE_FEED_SETTLE_SECONDS", 60)
+
+    assert change_feed.get_changes(db, since=since) == ([], since, False)
+
+
+# Test archived users show up as tombstones and reappear once restored
+def test_changes_endpoint(client: TestClient, superuser: User, db: Session):
+    user_id = create_user(db, "feedarchived").id
+    user_service.delete(db, user_id=user_id)
+    since = change_feed.encode_cursor((utcnow(), 0))
+    archive_service.archive_users(db, older_than_days=0)
+
+    login_data = {"username": superuser.username, "password": "admin123"}
+    response = client.post(f"{settings.API_V1_STR}/auth/login", data=login_data)
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    url = f"{settings.API_V1_STR}/users/changes"
+
+    response = client.get(url, params={"since": since}, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert [(c["id"], c["deleted"], c["user"]) for c in body["changes"]] == [
+        (user_id, True, None)
+    ]
+
+    client.post(f"{settings.API_V1_STR}/users/{user_id}/restore", headers=headers)
+    response = client.get(url, params={"since": body["next_cursor"]}, headers=headers)
+    changes = response.json()["changes"]
+    assert [(c["id"], c["deleted"]) for c in changes] == [(user_id, False)]
+    assert changes[0]["user"]["username"] == "feedarchived"
+
+    response = client.get(url, params={"since": "not-a-cursor"}, headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,97 @@
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.idempotency import (
+    DatabaseIdempotencyBackend,
+    IdempotencyStore,
+    MemoryIdempotencyBackend,
+    StoredResponse,
+)
+from app.db.session import Base
+from app.models.user import User
+
+
+# Test a retried create replays the first response without creating twice
+def test_create_user_idempotency_key(client, superuser, db):
+    login_response = client.post(
+        f"{settings.API_V1_STR}/auth/login",
+        data={"username": "admin", "password": "admin123"},
+    )
+    token = login_response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "create-1"}
+    new_user = {
+        "email": "retried@example.com",
+        "username": "retried",
+        "password": "retried123",
+    }
+
+    first = client.post(f"{settings.API_V1_STR}/users/", json=new_user, headers=headers)
+    retry = client.post(f"{settings.API_V1_STR}/users/", json=new_user, headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert db.query(User).filter(User.username == "retried").count() == 1
+
+    other = client.post(
+        f"{settings.API_V1_STR}/users/",
+        json={**new_user, "username": "other"},
+        headers=headers,
+    )
+    assert other.status_code == 422
+
+
+# Test token responses are never stored for replay
+def test_login_not_stored(client, normal_user):
+    def login():
+        return client.post(
+            f"{settings.API_V1_STR}/auth/login",
+            data={"username": "normaluser", "password": "user123"},
+            headers={"Idempotency-Key": "login-1"},
+        )
+
+    first, retry = login(), login()
+    assert first.status_code == retry.status_code == 200
+    assert "Idempotent-Replayed" not in retry.headers
+    assert retry.json()["refresh_token"] != first.json()["refresh_token"]
+
+
+# Test a concurrent duplicate waits for the original's response
+def test_duplicate_waits_for_in_flight_request():
+    store = IdempotencyStore(MemoryIdempotencyBackend())
+    assert store.begin("key", "body") is None
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(store.begin("key", "body")))
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()
+
+    response = StoredResponse(201, "application/json", b"{}")
+    store.complete("key", response)
+    waiter.join(5)
+    assert results == [response]
+
+    # A failed original frees the key for the retry
+    assert store.begin("failed", "body") is None
+    store.release("failed")
+    assert store.begin("failed", "body") is None
+
+
+# Test the database backend claims keys atomically and expires them
+def test_database_backend(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'idempotency.db'}")
+    Base.metadata.create_all(bind=engine)
+    backend = DatabaseIdempotencyBackend(sessionmaker(bind=engine))
+
+    assert backend.claim("key", "body", ttl=60) is None
+    assert backend.claim("key", "body", ttl=60).response is None
+    backend.complete("key", StoredResponse(200, "application/json", b"[]"))
+    record = backend.claim("key", "body", ttl=60)
+    assert record.response == StoredResponse(200, "application/json", b"[]")
+
+    assert backend.claim("stale", "body", ttl=-1) is None
+    assert backend.claim("stale", "other", ttl=60) is None
+    assert backend.prune() == 0
+    engine.dispose()
@@ -0,0 +1,113 @@
+import io
+import json
+import logging
+import os
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.logging import BackgroundLogWriter, InterceptHandler, should_log_request
+
+
+# Test per-route sampling rates
+def test_should_log_request(monkeypatch):
+    monkeypatch.setattr(settings, "LOG_SAMPLE_RATES", {"/health": 0.0})
+    assert not should_log_request("/health")
+    assert should_log_request("/api/v1/users/me")
+
+
+# Test the background writer emits JSON lines to both outputs
+def test_background_log_writer(tmp_path):
+    stream = io.StringIO()
+    writer = BackgroundLogWriter(str(tmp_path / "app.log"), stream=stream)
+    writer.start()
+    sink_id = logger.add(writer, format="{message}")
+    try:
+        logger.bind(request_id="abc").info("hello {}", "world")
+    finally:
+        logger.remove(sink_id)
+        writer.stop()
+
+    entry = json.loads(stream.getvalue().splitlines()[-1])
+    assert entry["message"] == "hello world"
+    assert entry["level"] == "INFO"
+    assert entry["extra"] == {"request_id": "abc"}
+    assert (tmp_path / "app.log").read_text() == stream.getvalue()
+
+
+# Test a writer follows a rotation done by another process's writer
+# instead of rotating the fresh file again
+def test_background_log_writer_shared_rotation(tmp_path):
+    path = str(tmp_path / "app.log")
+    first = BackgroundLogWriter(path, max_bytes=10)
+    second = BackgroundLogWriter(path, max_bytes=10)
+    first._file, second._file = open(path, "a"), open(path, "a")
+    try:
+        first._file.write("first" * 4)
+        first._file.flush()
+        first._rotate_if_needed()
+        second._file.write("second")
+        second._file.flush()
+        second._rotate_if_needed()
+        second._file.write("after")
+        second._file.flush()
+    finally:
+        first._file.close()
+        second._file.close()
+
+    rotated = [name for name in os.listdir(tmp_path) if name != "app.log"]
+    assert len(rotated) == 1
+    assert (tmp_path / rotated[0]).read_text() == "first" * 4 + "second"
+    assert (tmp_path / "app.log").read_text() == "after"
+
+
+# Test intercepted standard logging records keep their caller, whichever
+# stdlib entry point they came through
+def test_intercept_handler_caller():
+    records = []
+    sink_id = logger.add(records.append, format="{message}")
+    handler = InterceptHandler()
+    root = logging.getLogger()
+    std_logger = logging.getLogger("test_intercept")
+    std_logger.addHandler(handler)
+    std_logger.propagate = False
+    root_handlers, root_level = root.handlers[:], root.level
+    root.handlers, root.level = [handler], logging.INFO
+    try:
+        std_logger.warning("named")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            std_logger.exception("failed")
+        logging.warning("root")
+    finally:
+        std_logger.handlers.clear()
+        root.handlers, root.level = root_handlers, root_level
+        logger.remove(sink_id)
+
+    entries = [(r.record["message"], r.record["level"].name, r.record["function"]) for r in records]
+    assert entries == [
+        ("named", "WARNING", "test_intercept_handler_caller"),
+        ("failed", "ERROR", "test_intercept_handler_caller"),
+        ("root", "WARNING", "test_intercept_handler_caller"),
+    ]
+    assert records[1].record["exception"].type is ValueError
+
+
+# Test the writer rotates by bytes written, even if its queue never empties
+def test_background_log_writer_rotates_under_load(tmp_path):
+    path = str(tmp_path / "app.log")
+    writer = BackgroundLogWriter(path, max_bytes=200, stream=io.StringIO())
+    writer.start()
+    sink_id = logger.add(writer, format="{message}")
+    try:
+        for index in range(50):
+            logger.info("line {}", index)
+    finally:
+        logger.remove(sink_id)
+        writer.stop()
+
+    assert len(os.listdir(tmp_path)) > 1
+    # A file is rotated within a line of reaching max_bytes
+    for name in os.listdir(tmp_path):
+        assert os.path.getsize(tmp_path / name) < 200 + 200
@@ -0,0 +1,133 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core import profiling
+from app.core.config import settings
+from app.services import user as user_service
+
+
+def auth_headers(client, username, password):
+    response = client.post(
+        f"{settings.API_V1_STR}/auth/login",
+        data={"username": username, "password": password},
+    )
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def slow_get_multi(get_multi):
+    def wrapper(*args, **kwargs):
+        time.sleep(0.05)
+        return get_multi(*args, **kwargs)
+
+    return wrapper
+
+
+# Test a superuser's flagged request is sampled, with its SQL, into the buffer
+def test_sampling_profile(client, superuser, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_SAMPLE_INTERVAL_MS", 1)
+    monkeypatch.setattr(user_service, "get_multi", slow_get_multi(user_service.get_multi))
+    headers = auth_headers(client, "admin", "admin123")
+
+    response = client.get(
+        f"{settings.API_V1_STR}/users/", headers={**headers, "X-Profile": "sample"}
+    )
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile-Id"]
+
+    profile = client.get(
+        f"{settings.API_V1_STR}/profiles/{profile_id}", headers=headers
+    ).json()
+    assert profile["mode"] == "sample"
+    assert profile["path"] == f"{settings.API_V1_STR}/users/"
+    assert any("FROM users" in s["sql"] for s in profile["statements"])
+    assert "read_users" in profile["folded"]
+
+    folded = client.get(
+        f"{settings.API_V1_STR}/profiles/{profile_id}/folded", headers=headers
+    )
+    assert folded.text == profile["folded"]
+    listed = client.get(f"{settings.API_V1_STR}/profiles/", headers=headers).json()
+    assert [entry["id"] for entry in listed] == [profile_id]
+
+
+# Test the deterministic profiler reports per-function statistics
+def test_cprofile_profile(client, superuser):
+    headers = auth_headers(client, "admin", "admin123")
+
+    response = client.get(
+        f"{settings.API_V1_STR}/users/?profile=cprofile", headers=headers
+    )
+    profile = profiling.profiles.get(response.headers["X-Profile-Id"])
+    assert profile.mode == "cprofile"
+    assert "get_multi" in profile.stats
+
+
+# Test only one request is cProfiled at a time, overlapping ones being sampled
+def test_overlapping_cprofile_requests(client, superuser, monkeypatch):
+    def slower_get_multi(get_multi):
+        def wrapper(*args, **kwargs):
+            time.sleep(0.3)
+            return get_multi(*args, **kwargs)
+
+        return wrapper
+
+    monkeypatch.setattr(user_service, "get_multi", slower_get_multi(user_service.get_multi))
+    headers = auth_headers(client, "admin", "admin123")
+
+    def profiled(_):
+        return client.get(f"{settings.API_V1_STR}/users/?profile=cprofile", headers=headers)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        responses = list(pool.map(profiled, range(2)))
+    assert [response.status_code for response in responses] == [200, 200]
+    modes = sorted(
+        profiling.profiles.get(response.headers["X-Profile-Id"]).mode for response in responses
+    )
+    assert modes == ["cprofile", "sample"]
+
+    # Released once the profiled request finished
+    response = profiled(None)
+    assert profiling.profiles.get(response.headers["X-Profile-Id"]).mode == "cprofile"
+
+
+# Test an inline profile comes back with the response, for when another
+# worker would serve /profiles
+def test_inline_profile(client, superuser):
+    headers = auth_headers(client, "admin", "admin123")
+
+    response = client.get(
+        f"{settings.API_V1_STR}/users/me", headers={**headers, "X-Profile": "sample;inline"}
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["response"]["username"] == "admin"
+    assert body["profile"]["id"] == response.headers["X-Profile-Id"]
+    assert body["profile"]["mode"] == "sample"
+    assert any("FROM users" in s["sql"] for s in body["profile"]["statements"])
+
+
+# Test flags from anyone but a superuser are ignored
+def test_profile_flag_requires_superuser(client, normal_user):
+    headers = auth_headers(client, "normaluser", "user123")
+
+    response = client.get(
+        f"{settings.API_V1_STR}/users/me", headers={**headers, "X-Profile": "sample"}
+    )
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+    assert len(profiling.profiles) == 0
+
+
+# Test 1-in-N sampling keeps only the most recent profiles
+def test_sampled_requests_ring_buffer(client, normal_user, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_SAMPLE_EVERY_N", 1)
+    monkeypatch.setattr(profiling, "profiles", profiling.ProfileStore(2))
+    headers = auth_headers(client, "normaluser", "user123")
+
+    for _ in range(3):
+        client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+
+    # The login was sampled too, and has been pushed out
+    recent = profiling.profiles.list()
+    assert len(recent) == 2
+    assert all(p.sampled and p.path.endswith("/users/me") for p in recent)
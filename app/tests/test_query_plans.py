@@ -0,0 +1,43 @@
+import pytest
+from sqlalchemy import create_engine
+
+from app.db.query_plans import SERVICE_QUERIES, capture_plans
+from app.db.session import Base
+
+# The index each service query's first statement must use
+EXPECTED_INDEXES = {
+    "user.get": "INTEGER PRIMARY KEY",
+    "user.get_by_email": "ix_users_lower_email",
+    "user.get_by_username": "ix_users_lower_username",
+    "user.get_many": "INTEGER PRIMARY KEY",
+    "user.get_multi_by_created_at": "ix_users_created_at_id",
+    "refresh_token.rotate": "ix_refresh_tokens_token_hash",
+    "refresh_token.prune_expired": "ix_refresh_tokens_expires_at",
+    "archive.archive_users": "ix_users_inactive_since",
+    "activity.flush": "INTEGER PRIMARY KEY",
+    "change_feed.get_changes": "ix_users_updated_at_id",
+}
+
+
+@pytest.fixture(scope="module")
+def plans(tmp_path_factory):
+    path = tmp_path_factory.mktemp("plans") / "plans.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    yield capture_plans(engine)
+    engine.dispose()
+
+
+# Test every service query is captured and uses its index
+def test_service_query_plans(plans):
+    assert set(plans) == set(SERVICE_QUERIES)
+    for name, index in EXPECTED_INDEXES.items():
+        plan = "\n".join(plans[name][0]["plan"])
+        assert index in plan, f"{name} no longer uses {index}:\n{plan}"
+
+
+# Test listings walk an index instead of sorting
+def test_listing_plans_avoid_sorting(plans):
+    for name in ("user.get_multi", "user.get_multi_by_created_at", "change_feed.get_changes"):
+        for entry in plans[name]:
+            assert not any("TEMP B-TREE" in line for line in entry["plan"]), name
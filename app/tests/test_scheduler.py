@@ -0,0 +1,160 @@
+import asyncio
+import gzip
+import os
+import time
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.logging import LogConfig, rotate_log_files
+from app.core.metrics import metrics
+from app.core.scheduler import CLUSTER, PROCESS, FileLeaderLock, Job, Scheduler
+from app.db import maintenance
+from app.db.base import Base
+from app.db.session import make_engine
+from app.services import maintenance as maintenance_service
+
+
+def counter(name):
+    return metrics.snapshot()["counters"].get(name, 0)
+
+
+# Test only one lock holder at a time, and that leadership passes on release
+def test_file_leader_lock(tmp_path):
+    path = str(tmp_path / "scheduler.lock")
+    first, second = FileLeaderLock(path), FileLeaderLock(path)
+
+    assert first.acquire()
+    assert first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+# Test leader-only jobs are skipped by followers, and failures and
+# overruns are counted
+def test_run_job(tmp_path):
+    path = str(tmp_path / "scheduler.lock")
+    leader = FileLeaderLock(path)
+    assert leader.acquire()
+    runs = []
+    follower = Scheduler(
+        [Job("test_cluster_job", runs.append, 60, 10)],
+        {CLUSTER: FileLeaderLock(path)},
+    )
+
+    skipped = counter("scheduler.test_cluster_job.skipped")
+    follower.run_job(follower.jobs[0])
+    assert runs == []
+    assert counter("scheduler.test_cluster_job.skipped") == skipped + 1
+
+    leader.release()
+    follower.run_job(follower.jobs[0])
+    assert len(runs) == 1
+    assert runs[0] > time.monotonic()
+
+    def fail(deadline):
+        raise RuntimeError("boom")
+
+    failures = counter("scheduler.test_failing_job.failures")
+    follower.run_job(Job("test_failing_job", fail, 60, 10, scope=PROCESS))
+    assert counter("scheduler.test_failing_job.failures") == failures + 1
+
+    over = counter("scheduler.test_slow_job.over_budget")
+    follower.run_job(Job("test_slow_job", lambda deadline: time.sleep(0.02), 60, 0.01))
+    assert counter("scheduler.test_slow_job.over_budget") == over + 1
+    follower.shutdown()
+
+
+# Test jobs run at start and then every interval
+def test_scheduler_loop():
+    runs = {"start": 0, "later": 0}
+    jobs = [
+        Job("test_start", lambda d: runs.update(start=runs["start"] + 1), 0.05, 1, PROCESS, True),
+        Job("test_later", lambda d: runs.update(later=runs["later"] + 1), 10, 1, PROCESS),
+    ]
+    scheduler = Scheduler(jobs, {}, jitter=0, tick=0.01)
+
+    async def run_for(seconds):
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(seconds)
+        task.cancel()
+
+    asyncio.run(run_for(0.2))
+    scheduler.shutdown()
+    assert runs["start"] >= 2
+    assert runs["later"] == 0
+
+
+# Test a slow leader job doesn't hold up the per-process jobs
+def test_scheduler_scopes_run_apart(tmp_path):
+    runs = []
+    jobs = [
+        Job("test_slow_cluster", lambda d: time.sleep(0.5), 60, 1, CLUSTER, True),
+        Job("test_process", runs.append, 0.05, 1, PROCESS, True),
+    ]
+    scheduler = Scheduler(
+        jobs, {CLUSTER: FileLeaderLock(str(tmp_path / "scheduler.lock"))}, jitter=0, tick=0.01
+    )
+
+    async def run_for(seconds):
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(seconds)
+        task.cancel()
+
+    asyncio.run(run_for(0.3))
+    scheduler.shutdown()
+    assert len(runs) >= 3
+
+
+# Test disabling the scheduler keeps the per-process jobs
+def test_scheduler_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "SCHEDULER_ENABLED", False)
+    jobs = maintenance_service.make_jobs()
+    assert {job.name for job in jobs} >= {"flush_activity", "refresh_availability"}
+    assert all(job.scope == PROCESS for job in jobs)
+
+
+# Test rotated logs are compressed once idle, then deleted once past retention
+def test_rotate_log_files(tmp_path):
+    config = LogConfig(LOG_FILE=str(tmp_path / "app.log"))
+    (tmp_path / "app.log").write_text("current\n")
+    recent = tmp_path / "app.log.2026-10-01_00-00-00"
+    recent.write_text("recent\n")
+    hour_ago = time.time() - 60 * 60
+    os.utime(recent, (hour_ago, hour_ago))
+    # Possibly still written by a worker yet to notice the rotation
+    (tmp_path / "app.log.2026-10-19_00-00-00").write_text("in use\n")
+    old = tmp_path / "app.log.2026-01-01_00-00-00"
+    old.write_text("old\n")
+    month_ago = time.time() - 30 * 24 * 60 * 60
+    os.utime(old, (month_ago, month_ago))
+    (tmp_path / "scheduler.lock").write_text("")
+
+    assert rotate_log_files(config, retention_days=14) == (1, 1)
+    assert sorted(os.listdir(tmp_path)) == [
+        "app.log",
+        "app.log.2026-10-01_00-00-00.gz",
+        "app.log.2026-10-19_00-00-00",
+        "scheduler.lock",
+    ]
+    with gzip.open(tmp_path / "app.log.2026-10-01_00-00-00.gz", "rt") as rotated:
+        assert rotated.read() == "recent\n"
+
+
+# Test statistics are gathered for the maintained tables within the budget
+def test_analyze(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'analyze.db'}")
+    Base.metadata.create_all(bind=engine)
+
+    done = maintenance.analyze(
+        engine, maintenance.MAINTAINED_TABLES, deadline=time.monotonic() + 10
+    )
+    assert done == list(maintenance.MAINTAINED_TABLES)
+    with engine.connect() as connection:
+        assert connection.execute(
+            text("SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'")
+        ).scalar()
+    assert maintenance.analyze(engine, ["users"], deadline=time.monotonic()) == []
+    engine.dispose()
@@ -0,0 +1,188 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import event, text
+
+from app.db import sharding
+from app.db.base import Base
+from app.core.config import settings
+from app.db.session import make_engine
+from app.services import archive as archive_service
+from app.services import change_feed
+from app.services.availability import availability
+from app.services import refresh_token as refresh_token_service
+from app.services import user as user_service
+from app.services.activity import ActivityBuffer
+
+
+# Users spread over three SQLite shards, directory on a fourth file
+@pytest.fixture
+def shards(tmp_path):
+    primary = make_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    shard_engines = {
+        f"shard{index}": make_engine(f"sqlite:///{tmp_path / f'shard{index}.db'}")
+        for index in range(3)
+    }
+    Base.metadata.create_all(bind=primary)
+    for shard_engine in shard_engines.values():
+        Base.metadata.create_all(
+            bind=shard_engine, tables=sharding.sharded_tables(Base.metadata.tables)
+        )
+    yield shard_engines
+    for shard_engine in [primary, *shard_engines.values()]:
+        shard_engine.dispose()
+
+
+@pytest.fixture
+def sharded_db(shards, tmp_path):
+    primary = make_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    session = sharding.make_sessionmaker(primary, shards)()
+    yield session
+    session.close()
+    primary.dispose()
+
+
+def create_users(db, count):
+    return [
+        user_service.create(
+            db,
+            obj_in={
+                "email": f"user{index}@example.com",
+                "username": f"user{index}",
+                "password": "secret123",
+            },
+        )
+        for index in range(count)
+    ]
+
+
+def shard_user_ids(engine):
+    with engine.connect() as connection:
+        return {row[0] for row in connection.execute(text("SELECT id FROM users"))}
+
+
+# Test users get global ids and land on the shard their id maps to
+def test_sharded_create_and_lookup(shards, sharded_db):
+    users = create_users(sharded_db, 6)
+    ids = [user.id for user in users]
+    assert len(set(ids)) == 6
+
+    for shard_id, shard_engine in shards.items():
+        stored = shard_user_ids(shard_engine)
+        assert stored == {
+            user_id for user_id in ids if sharded_db.shard_for_user(user_id) == shard_id
+        }
+        assert stored
+
+    sharded_db.expunge_all()
+    assert user_service.get(sharded_db, user_id=ids[4]).username == "user4"
+    assert user_service.get_by_username(sharded_db, username="user2").id == ids[2]
+    assert user_service.get_by_email(sharded_db, email="user5@example.com").id == ids[5]
+    assert user_service.get_by_username(sharded_db, username="nobody") is None
+    found = user_service.get_many(sharded_db, [ids[3], 999, ids[0]])
+    assert [user.id if user else None for user in found] == [ids[3], None, ids[0]]
+
+
+# Test listing fans out to every shard and merges in id order
+def test_sharded_get_multi(sharded_db):
+    ids = [user.id for user in create_users(sharded_db, 7)]
+
+    page = user_service.get_multi(sharded_db, skip=2, limit=3)
+    assert [user.id for user in page] == sorted(ids)[2:5]
+
+
+# Test renames, archival and restores keep the directory in step
+def test_sharded_update_and_delete(shards, sharded_db):
+    user = create_users(sharded_db, 2)[1]
+    user_service.update(sharded_db, db_obj=user, obj_in={"username": "renamed"})
+
+    assert user_service.get_by_username(sharded_db, username="renamed").id == user.id
+    assert user_service.get_by_username(sharded_db, username="user1") is None
+
+    user_id = user.id
+    shard = shards[sharded_db.shard_for_user(user_id)]
+    user_service.delete(sharded_db, user_id=user_id)
+    assert user_service.get(sharded_db, user_id=user_id) is None
+    assert user_id in shard_user_ids(shard)
+
+    assert archive_service.archive_users(sharded_db, older_than_days=0) == 1
+    assert user_id not in shard_user_ids(shard)
+    assert user_service.get_by_username(sharded_db, username="renamed") is None
+
+    sharded_db.expunge_all()
+    assert archive_service.restore(sharded_db, user_id=user_id).id == user_id
+    assert user_service.get_by_username(sharded_db, username="renamed").id == user_id
+
+
+# Test the change feed merges every shard's changes and tombstones in order
+def test_sharded_change_feed(sharded_db, monkeypatch):
+    monkeypatch.setattr(settings, "CHANGE_FEED_SETTLE_SECONDS", 0)
+    ids = [user.id for user in create_users(sharded_db, 5)]
+    user_service.delete(sharded_db, user_id=ids[1])
+    archive_service.archive_users(sharded_db, older_than_days=0)
+
+    seen, since, has_more = [], None, True
+    while has_more:
+        page, since, has_more = change_feed.get_changes(sharded_db, since=since, limit=2)
+        seen += [(change.id, change.deleted) for change in page]
+    assert seen == [(user_id, False) for user_id in ids if user_id != ids[1]] + [
+        (ids[1], True)
+    ]
+
+
+# Test the availability filter is built from the directory on the primary
+def test_sharded_availability_rebuild(sharded_db):
+    create_users(sharded_db, 4)
+    assert availability.rebuild(sharded_db) == 8
+    assert availability.might_be_taken(username="USER3")
+    assert user_service.check_availability(sharded_db, username="user3") == {
+        "username": False
+    }
+
+
+# Test refresh tokens and activity writes follow their user's shard
+def test_sharded_user_owned_rows(sharded_db):
+    users = create_users(sharded_db, 3)
+    token = refresh_token_service.issue(sharded_db, user=users[1])
+    rotated = refresh_token_service.rotate(sharded_db, token=token)
+    assert rotated is not None
+    assert rotated[1].id == users[1].id
+
+    buffer = ActivityBuffer()
+    for user in users:
+        buffer.record_login(user.id)
+    assert buffer.flush(sharded_db) == 3
+    sharded_db.expire_all()
+    assert all(user_service.get(sharded_db, user_id=user.id).last_login_at for user in users)
+
+
+# Test coalesced lookups hand each session a copy routed to the right shard
+def test_sharded_coalesced_get(shards, sharded_db, tmp_path):
+    user_id = create_users(sharded_db, 2)[1].id
+    primary = make_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    Session = sharding.make_sessionmaker(primary, shards)
+    queries = []
+
+    def slow_query(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT"):
+            queries.append(statement)
+            time.sleep(0.2)
+
+    for shard_engine in shards.values():
+        event.listen(shard_engine, "before_cursor_execute", slow_query)
+    sessions = [Session() for _ in range(3)]
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        users = list(
+            pool.map(lambda db: user_service.get(db, user_id=user_id), sessions)
+        )
+    for shard_engine in shards.values():
+        event.remove(shard_engine, "before_cursor_execute", slow_query)
+    assert len(queries) == 1
+
+    user_service.update(sessions[2], db_obj=users[2], obj_in={"first_name": "Copy"})
+    sharded_db.expire_all()
+    assert user_service.get(sharded_db, user_id=user_id).first_name == "Copy"
+    for db in sessions:
+        db.close()
+    primary.dispose()
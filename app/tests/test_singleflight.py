@@ -0,0 +1,232 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.session import Base, get_db
+from app.services import user as user_service
+from app.utils.singleflight import SingleFlight
+
+
+def slow_call(calls, result=None, error=None):
+    def fn():
+        calls.append(threading.get_ident())
+        time.sleep(0.2)
+        if error:
+            raise error
+        return result
+
+    return fn
+
+
+# Test concurrent sync callers share one call, its result and its errors
+def test_single_flight_threads():
+    flight = SingleFlight("test_flight")
+    calls = []
+    before = metrics.snapshot()["counters"].get("test_flight.coalesced", 0)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda _: flight.do("key", slow_call(calls, 42)), range(4)))
+    assert len(calls) == 1
+    assert sorted(results) == [(42, False), (42, True), (42, True), (42, True)]
+    assert metrics.snapshot()["counters"]["test_flight.coalesced"] == before + 3
+
+    def failing(_):
+        with pytest.raises(ValueError):
+            flight.do("key", slow_call(calls, error=ValueError("boom")))
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        list(pool.map(failing, range(3)))
+    assert len(calls) == 2
+
+
+# Test async callers join the same flight
+def test_single_flight_async():
+    flight = SingleFlight("test_flight")
+    calls = []
+
+    async def main():
+        return await asyncio.gather(
+            *[flight.do_async("key", slow_call(calls, "x")) for _ in range(3)]
+        )
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [result for result, _ in results] == ["x", "x", "x"]
+
+
+# Test waiting callers get what share makes of the result, built only
+# when someone waits
+def test_single_flight_share():
+    flight = SingleFlight("test_flight")
+    calls, shared = [], []
+
+    def share(result):
+        shared.append(result)
+        return f"copy of {result}"
+
+    assert flight.do("key", slow_call(calls, "x"), share=share) == ("x", False)
+    assert shared == []
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        results = list(
+            pool.map(lambda _: flight.do("key", slow_call(calls, "y"), share=share), range(3))
+        )
+    assert sorted(results) == [("copy of y", True), ("copy of y", True), ("y", False)]
+    assert shared == ["y"]
+
+
+# Test concurrent user lookups run one query, each caller getting its own instance
+def test_user_get_coalesced(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'flight.db'}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        user_id = user_service.create(
+            db,
+            obj_in={
+                "email": "flight@example.com",
+                "username": "flight",
+                "password": "secret123",
+            },
+        ).id
+
+    queries = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def slow_query(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT"):
+            queries.append(statement)
+            time.sleep(0.2)
+
+    def lookup(_):
+        db = Session()
+        user = user_service.get(db, user_id=user_id)
+        return db, user
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lookup, range(4)))
+    assert len(queries) == 1
+    for db, user in results:
+        assert user.username == "flight"
+        assert user in db
+    # Shared copies are ordinary persistent instances of their session
+    db, user = results[-1]
+    user_service.update(db, db_obj=user, obj_in={"first_name": "Coalesced"})
+    assert user_service.get(db, user_id=user_id).first_name == "Coalesced"
+    for db, _ in results:
+        db.close()
+    engine.dispose()
+
+
+# Test a session in a transaction neither shares its rows nor waits on another's
+def test_user_get_not_coalesced_in_transaction(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'flight.db'}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        user_id = user_service.create(
+            db,
+            obj_in={
+                "email": "flight@example.com",
+                "username": "flight",
+                "password": "secret123",
+                "first_name": "Committed",
+            },
+        ).id
+
+    writer = Session()
+    user = user_service.get(writer, user_id=user_id)
+    user.first_name = "Uncommitted"
+    writer.flush()
+
+    queries = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def slow_query(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT"):
+            queries.append(statement)
+            time.sleep(0.2)
+
+    reader = Session()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        in_transaction = pool.submit(user_service.get, writer, user_id=user_id)
+        fresh = pool.submit(user_service.get, reader, user_id=user_id)
+        assert in_transaction.result().first_name == "Uncommitted"
+        assert fresh.result().first_name == "Committed"
+    assert len(queries) == 2
+    writer.rollback()
+    writer.close()
+    reader.close()
+    engine.dispose()
+
+
+# Test concurrent authenticated requests for one user run a single query
+# for it, with the session's authentication read out of the way
+def test_read_user_coalesced_over_http(client, tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'flight.db'}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        user_service.create(
+            db,
+            obj_in={
+                "email": "admin@example.com",
+                "username": "admin",
+                "password": "admin123",
+                "is_superuser": True,
+            },
+        )
+        target_id = user_service.create(
+            db,
+            obj_in={
+                "email": "target@example.com",
+                "username": "target",
+                "password": "secret123",
+            },
+        ).id
+
+    def fresh_session():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    client.app.dependency_overrides[get_db] = fresh_session
+    try:
+        token = client.post(
+            f"{settings.API_V1_STR}/auth/login",
+            data={"username": "admin", "password": "admin123"},
+        ).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        queries = []
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def slow_query(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("SELECT") and target_id in parameters:
+                queries.append(statement)
+                time.sleep(0.3)
+
+        def read(_):
+            return client.get(f"{settings.API_V1_STR}/users/{target_id}", headers=headers)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            responses = list(pool.map(read, range(4)))
+    finally:
+        client.app.dependency_overrides.pop(get_db, None)
+        engine.dispose()
+    assert [response.status_code for response in responses] == [200] * 4
+    assert all(response.json()["username"] == "target" for response in responses)
+    assert len(queries) == 1
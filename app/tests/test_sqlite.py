@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+from app.db.session import make_engine
+
+
+def create_table(engine):
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, n INTEGER)"))
+
+
+# Test file-backed SQLite connections get the production pragmas
+def test_sqlite_pragmas(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+    with engine.connect() as connection:
+        pragma = lambda name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+        assert pragma("journal_mode") == "wal"
+        assert pragma("synchronous") == 1
+        assert pragma("busy_timeout") == 5000
+        assert pragma("cache_size") == -64000
+    engine.dispose()
+
+
+# Test concurrent writers queue instead of failing with "database is locked"
+def test_sqlite_concurrent_writers(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'writers.db'}")
+    create_table(engine)
+
+    def write(n):
+        for _ in range(20):
+            with engine.begin() as connection:
+                total = connection.execute(text("SELECT count(*) FROM items")).scalar()
+                connection.execute(
+                    text("INSERT INTO items (n) VALUES (:n)"), {"n": n * 1000 + total}
+                )
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(write, range(8)))
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM items")).scalar() == 160
+    engine.dispose()
+
+
+# Test readers aren't blocked while a write transaction is open
+def test_sqlite_readers_during_write(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'readers.db'}")
+    create_table(engine)
+    with engine.connect() as writer:
+        writer.execute(text("INSERT INTO items (n) VALUES (1)"))
+        def read(_):
+            with engine.connect() as reader:
+                return reader.execute(text("SELECT count(*) FROM items")).scalar()
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            counts = list(pool.map(read, range(4)))
+        # Readers see the last committed state
+        assert counts == [0, 0, 0, 0]
+        writer.commit()
+    engine.dispose()
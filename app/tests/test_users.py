@@ -1,86 +1,10 @@
 import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import IntegrityError
 
 from app.core.config import settings
-from app.db.session import Base, get_db
-from app.main import app
 from app.services import user as user_service
 
 
-# Use an in-memory SQLite database for testing
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-
-# Setup test database
-@pytest.fixture(scope="function")
-def db():
-    # Create the database and tables
-    Base.metadata.create_all(bind=engine)
-    
-    # Create a connection and session
-    connection = engine.connect()
-    transaction = connection.begin()
-    session = TestingSessionLocal(bind=connection)
-    
-    # Begin a nested transaction
-    nested = connection.begin_nested()
-    
-    # Override the get_db dependency
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            pass
-    
-    app.dependency_overrides[get_db] = override_get_db
-    
-    yield session
-    
-    # Rollback the transaction
-    session.close()
-    transaction.rollback()
-    connection.close()
-
-
-# Test client
-@pytest.fixture(scope="module")
-def client():
-    with TestClient(app) as c:
-        yield c
-
-
-# Create a test superuser
-@pytest.fixture(scope="function")
-def superuser(db):
-    user_in = {
-        "email": "admin@example.com",
-        "username": "admin",
-        "password": "admin123",
-        "is_superuser": True,
-    }
-    user = user_service.create(db, obj_in=user_in)
-    return user
-
-
-# Create a test normal user
-@pytest.fixture(scope="function")
-def normal_user(db):
-    user_in = {
-        "email": "user@example.com",
-        "username": "normaluser",
-        "password": "user123",
-        "is_superuser": False,
-    }
-    user = user_service.create(db, obj_in=user_in)
-    return user
-
-
 # Test authentication
 def test_login(client, normal_user):
     response = client.post(
@@ -171,3 +95,83 @@ def test_update_user(client, normal_user):
     data = response.json()
     assert data["first_name"] == update_data["first_name"]
     assert data["last_name"] == update_data["last_name"]
+
+
+# Test batch lookup keeps request order and marks missing users
+def test_read_users_batch(client, superuser, normal_user):
+    login_response = client.post(
+        f"{settings.API_V1_STR}/auth/login",
+        data={"username": "admin", "password": "admin123"},
+    )
+    token = login_response.json()["access_token"]
+
+    ids = [normal_user.id, 999999, superuser.id]
+    response = client.get(
+        f"{settings.API_V1_STR}/users/batch",
+        params={"ids": ",".join(str(user_id) for user_id in ids)},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["id"] for item in data] == ids
+    assert [item["status"] for item in data] == ["found", "not_found", "found"]
+    assert data[0]["user"]["username"] == normal_user.username
+    assert data[1]["user"] is None
+
+
+# Test batch lookup applies the per-user permission rules
+def test_read_users_batch_normal_user(client, superuser, normal_user):
+    login_response = client.post(
+        f"{settings.API_V1_STR}/auth/login",
+        data={"username": "normaluser", "password": "user123"},
+    )
+    token = login_response.json()["access_token"]
+
+    response = client.post(
+        f"{settings.API_V1_STR}/users/batch",
+        json={"ids": [superuser.id, normal_user.id]},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["status"] for item in data] == ["forbidden", "found"]
+
+
+# Test get_many chunks large id lists
+def test_get_many_chunks(db, superuser, normal_user):
+    ids = [normal_user.id, 999999, superuser.id, normal_user.id]
+    users = user_service.get_many(db, ids, chunk_size=1)
+    assert [user.id if user else None for user in users] == [
+        normal_user.id, None, superuser.id, normal_user.id
+    ]
+
+
+# Test email and username lookups ignore case
+def test_lookups_ignore_case(db, normal_user):
+    assert user_service.get_by_email(db, email="USER@example.com").id == normal_user.id
+    assert user_service.get_by_username(db, username="NormalUser").id == normal_user.id
+
+
+# Test names differing only in case can't both be taken
+def test_names_unique_ignoring_case(db, normal_user):
+    with pytest.raises(IntegrityError):
+        user_service.create(
+            db,
+            obj_in={
+                "email": "other@example.com",
+                "username": "NormalUser",
+                "password": "other123",
+            },
+        )
+    db.rollback()
+    with pytest.raises(IntegrityError):
+        user_service.create(
+            db,
+            obj_in={
+                "email": "USER@example.com",
+                "username": "other",
+                "password": "other123",
+            },
+        )
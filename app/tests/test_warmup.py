@@ -0,0 +1,30 @@
+import time
+
+from app.core.warmup import open_connections
+from app.db.session import make_engine
+
+
+# Test /ready only succeeds once warm-up has run, unlike /health
+def test_ready_after_warm_up(client):
+    assert client.get("/health").status_code == 200
+    deadline = time.monotonic() + 10
+    response = client.get("/ready")
+    while response.status_code == 503 and time.monotonic() < deadline:
+        time.sleep(0.05)
+        response = client.get("/ready")
+    assert response.status_code == 200
+    assert client.app.openapi_schema is not None
+    snapshot = client.get("/metrics").json()
+    assert "warmup.pool" in snapshot["timings"]
+    assert "warmup.failures" not in snapshot["counters"]
+
+
+# Test pre-opened connections stay in the pool
+def test_open_connections(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'warm.db'}")
+    open_connections(engine, 3)
+    assert engine.pool.checkedin() == 3
+    open_connections(engine, 50)
+    assert engine.pool.checkedin() == engine.pool.size()
+    engine.dispose()
+    assert engine.pool.checkedin() == 0
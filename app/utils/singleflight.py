@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.metrics import metrics
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one.
+
+    The first caller for a key (the leader) runs the function; callers
+    arriving while it runs wait for, and share, its result or exception.
+    Nothing is cached once the leader finishes. Sync callers block their
+    thread, async callers await, and both can join the same flight.
+
+    ``share``, if given, turns the leader's result into what the waiting
+    callers get. It runs in the leader's thread, and only if any joined.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._calls: Dict[Hashable, "Future[Any]"] = {}
+        # Callers waiting on each flight
+        self._waiting: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Any],
+        share: Optional[Callable[[Any], Any]] = None,
+    ) -> Tuple[Any, bool]:
+        """Run ``fn`` once per flight, returning its result and whether it was shared"""
+        call, leader = self._join(key)
+        if leader:
+            return self._run(key, call, fn, share), False
+        return call.result(), True
+
+    async def do_async(
+        self,
+        key: Hashable,
+        fn: Callable[[], Any],
+        share: Optional[Callable[[Any], Any]] = None,
+    ) -> Tuple[Any, bool]:
+        """Like ``do``, with the leader running blocking ``fn`` in the threadpool"""
+        call, leader = self._join(key)
+        if leader:
+            return await run_in_threadpool(self._run, key, call, fn, share), False
+        return await asyncio.wrap_future(call), True
+
+    def _join(self, key: Hashable) -> Tuple["Future[Any]", bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                metrics.inc(f"{self.name}.coalesced")
+                self._waiting[key] += 1
+                return call, False
+            call = self._calls[key] = Future()
+            self._waiting[key] = 0
+            return call, True
+
+    def _finish(self, key: Hashable) -> int:
+        # Later callers start a flight of their own
+        with self._lock:
+            del self._calls[key]
+            return self._waiting.pop(key)
+
+    def _run(
+        self,
+        key: Hashable,
+        call: "Future[Any]",
+        fn: Callable[[], Any],
+        share: Optional[Callable[[Any], Any]],
+    ) -> Any:
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key)
+            call.set_exception(e)
+            raise
+        waiting = self._finish(key)
+        if not waiting:
+            call.set_result(result)
+            return result
+        try:
+            call.set_result(result if share is None else share(result))
+        except BaseException as e:
+            call.set_exception(e)
+        return result
@@ -0,0 +1,158 @@
+"""
+Measure the cost of logging on the request path for each logging profile.
+
+Only the logging path is timed: ``RequestLoggingMiddleware`` in front of a
+trivial ASGI app, called directly on one event loop, and a bare ``logger``
+call into the configured sinks. No application, lifespan or database is
+involved. Each case is warmed up first, then timed call by call; the
+median and p95 are reported, overhead against the same path with no sinks.
+
+Run from the project root:
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.bench_logging
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+from starlette.responses import PlainTextResponse
+
+from app.core.logging import InterceptHandler, LogConfig, setup_logging
+from app.core.middleware import RequestLoggingMiddleware
+
+WARMUP = 1000
+ITERATIONS = 20000
+PROFILES = (None, "development", "production")
+
+
+def summarize(samples: List[float]) -> Tuple[float, float]:
+    """Median and p95, in microseconds"""
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95)]
+    return statistics.median(samples) * 1e6, p95 * 1e6
+
+
+def time_calls(fn: Callable[[], None]) -> Tuple[float, float]:
+    for _ in range(WARMUP):
+        fn()
+    samples = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def bench_middleware(loop: asyncio.AbstractEventLoop) -> Tuple[float, float]:
+    """One request through the logging middleware to an app doing nothing"""
+    middleware = RequestLoggingMiddleware(PlainTextResponse("ok"))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/bench",
+        "raw_path": b"/bench",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "client": ("127.0.0.1", 1234),
+        "server": ("testserver", 80),
+    }
+
+    def receiver():
+        messages = iter([{"type": "http.request", "body": b"", "more_body": False}])
+
+        async def receive():
+            # The middleware listens for a disconnect once the body is read
+            return next(messages, {"type": "http.disconnect"})
+
+        return receive
+
+    async def send(message):
+        pass
+
+    async def requests(count: int) -> List[float]:
+        samples = []
+        for _ in range(count):
+            receive = receiver()
+            start = time.perf_counter()
+            await middleware(scope, receive, send)
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    loop.run_until_complete(requests(WARMUP))
+    return summarize(loop.run_until_complete(requests(ITERATIONS)))
+
+
+def bench_logger_call() -> Tuple[float, float]:
+    return time_calls(lambda: logger.info("GET {} [{}] {:.4f}s", "/bench", 200, 0.001))
+
+
+def bench_intercept(stdlib_level: int) -> Tuple[float, float]:
+    """Cost of a stdlib DEBUG record with loguru filtering at INFO"""
+    stdlib_logger = logging.getLogger("bench")
+    stdlib_logger.handlers = [InterceptHandler()]
+    stdlib_logger.propagate = False
+    stdlib_logger.setLevel(stdlib_level)
+    return time_calls(lambda: stdlib_logger.debug("benchmark record"))
+
+
+def configure(profile: Optional[str], log_dir: str) -> None:
+    if profile is None:
+        logger.remove()
+        return
+    setup_logging(
+        LogConfig(
+            LOG_PROFILE=profile,
+            LOG_FILE=os.path.join(log_dir, f"{profile}.log"),
+            # Room for every record, so none are dropped rather than written
+            LOG_QUEUE_SIZE=2 * (WARMUP + ITERATIONS),
+        )
+    )
+
+
+def main() -> None:
+    log_dir = tempfile.mkdtemp()
+    # Sinks write to stderr; keep the terminal readable
+    devnull = open(os.devnull, "w")
+    real_stderr, sys.stderr = sys.stderr, devnull
+
+    loop = asyncio.new_event_loop()
+    results: Dict[Tuple[str, str], Tuple[float, float]] = {}
+    for profile in PROFILES:
+        name = profile or "no sinks"
+        configure(profile, log_dir)
+        results[(name, "middleware")] = bench_middleware(loop)
+        configure(profile, log_dir)
+        results[(name, "logger.info")] = bench_logger_call()
+    loop.close()
+
+    setup_logging(LogConfig(LOG_FILE=os.path.join(log_dir, "intercept.log")))
+    intercept = [
+        # The stdlib level used to be 0, forwarding every record to loguru
+        ("debug record, forwarded to loguru", bench_intercept(1)),
+        ("debug record, gated by stdlib level", bench_intercept(logging.INFO)),
+    ]
+    logger.remove()
+    sys.stderr = real_stderr
+
+    print(f"{'case':<36}{'median us':>12}{'p95 us':>12}{'overhead':>12}")
+    for (name, case), (median, p95) in results.items():
+        overhead = median - results[("no sinks", case)][0]
+        print(f"{name + ' ' + case:<36}{median:>12.2f}{p95:>12.2f}{overhead:>12.2f}")
+    print()
+    print(f"{'case':<36}{'median us':>12}{'p95 us':>12}")
+    for name, (median, p95) in intercept:
+        print(f"{name:<36}{median:>12.2f}{p95:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Measure per-call overhead of the user lookups: legacy ``db.query()`` chains
+built on every call against the module-level cached statements the service
+now uses.
+
+Run from the project root:
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.bench_user_lookups
+"""
+import os
+import tempfile
+import timeit
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from app.db.base import Base
+from app.db.session import make_engine
+from app.models.user import User
+from app.services import user as user_service
+
+USERS = 1000
+CALLS = 5000
+
+
+def per_call_us(fn) -> float:
+    return min(timeit.repeat(fn, number=CALLS, repeat=5)) / CALLS * 1e6
+
+
+def legacy_get(db: Session, user_id: int):
+    return db.query(User).filter(User.deleted_at.is_(None)).filter(User.id == user_id).first()
+
+
+def legacy_get_by_username(db: Session, username: str):
+    return (
+        db.query(User)
+        .filter(User.deleted_at.is_(None))
+        .filter(func.lower(User.username) == username.lower())
+        .first()
+    )
+
+
+def legacy_get_multi(db: Session, skip: int, limit: int):
+    return (
+        db.query(User)
+        .filter(User.deleted_at.is_(None))
+        .order_by(User.id)
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+
+
+def main() -> None:
+    path = os.path.join(tempfile.mkdtemp(), "lookups.db")
+    engine = make_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(User),
+            [
+                {
+                    "email": f"user{n}@example.com",
+                    "username": f"user{n}",
+                    "hashed_password": "x",
+                }
+                for n in range(USERS)
+            ],
+        )
+
+    cases = [
+        (
+            "get",
+            lambda db: legacy_get(db, 500),
+            lambda db: user_service.get(db, user_id=500),
+        ),
+        (
+            "get_by_username",
+            lambda db: legacy_get_by_username(db, "User500"),
+            lambda db: user_service.get_by_username(db, username="User500"),
+        ),
+        (
+            "get_multi (10 rows)",
+            lambda db: legacy_get_multi(db, 100, 10),
+            lambda db: user_service.get_multi(db, skip=100, limit=10),
+        ),
+    ]
+    print(f"{'lookup':<22}{'legacy query':>14}{'cached stmt':>14}")
+    with Session(engine) as db:
+        for name, legacy, cached in cases:
+            legacy_us = per_call_us(lambda: legacy(db))
+            cached_us = per_call_us(lambda: cached(db))
+            print(f"{name:<22}{legacy_us:>12.1f}us{cached_us:>12.1f}us")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()